@@ -1,12 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from utils.services import get_ai_response, send_risk_alert, send_otp_email
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, stream_with_context, send_from_directory, abort
+from utils.services import get_ai_response, stream_ai_response, send_risk_alert, send_otp_email, warm_ai_client, response_cache, ai_status
 import utils.db as db
+import utils.tracking as tracking
+import utils.drift as drift
+from utils.sessions import SqliteSessionInterface, start_session_gc
+from utils.mailer import start_mail_workers
+from utils.response_cache import is_faq
+import utils.ratelimit as ratelimit
+import utils.metrics as metrics
+import utils.profiling as profiling
+import utils.assets as assets
+import utils.startup as startup
 import secrets
+import threading
 import os
 import datetime
 import json
 from dotenv import load_dotenv
-from utils.models import HeartDiseasePredictor
+from utils.models import HeartDiseasePredictor, RISK_THRESHOLD
+from utils.timeseries import lttb
+from utils.percentiles import risk_percentile
+from utils.neighbors import similar_profiles
+from utils.whatif import what_if
 
 # Load environment variables
 load_dotenv()
@@ -15,13 +30,65 @@ app = Flask(__name__)
 # Use SECRET_KEY from env, fallback to a random one if not found
 app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(16))
 app.permanent_session_lifetime = datetime.timedelta(hours=24)
+# Keep session data server-side; the cookie only carries a signed session id
+app.session_interface = SqliteSessionInterface()
+# Opt-in cProfile captures (admin X-Profile header or PROFILE_SAMPLE_RATE), listed at /admin/profiles
+profiling.init_app(app)
+# Per-endpoint request counts and latency histograms, served at /metrics
+metrics.init_app(app)
+# Token-bucket limits per user/IP on expensive routes, plus a global concurrency cap
+ratelimit.init_app(app)
+# Fingerprinted, long-cached static files, compressed text responses, cached template bytecode
+assets.init_app(app)
 
-# Initialize DB
-db.migrate_from_files()
+# Number of chat turns loaded per page in /chat
+CHAT_WINDOW = int(os.getenv('CHAT_WINDOW', 20))
+# Risk trend chart point budget and tests listed on /profile
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 120))
+PROFILE_HISTORY_ROWS = int(os.getenv('PROFILE_HISTORY_ROWS', 50))
+TREND_MODES = ('auto', 'raw', 'daily', 'weekly')
 
-# Initialize predictor
+# Initialize predictor (models load on first use, or via predictor.preload())
 predictor = HeartDiseasePredictor()
 
+_setup_done = False
+_setup_lock = threading.Lock()
+
+def setup_app():
+    """
+    One-time, per-process initialization: DB schema and background threads.
+    Kept out of import time so importing the app stays fast; runs on the first request
+    unless a server hook (or `flask --app app init-db`) calls it earlier.
+    """
+    global _setup_done
+    if _setup_done:
+        return
+    with _setup_lock:
+        if _setup_done:
+            return
+        with startup.phase('database'):
+            db.ensure_schema()
+        with startup.phase('background services'):
+            start_session_gc()
+            start_mail_workers()
+            metrics.start_flusher()
+            drift.start_drift_flusher()
+            warm_ai_client()
+        _setup_done = True
+
+_wsgi_app = app.wsgi_app
+
+def _wsgi_app_with_setup(environ, start_response):
+    setup_app()
+    return _wsgi_app(environ, start_response)
+
+app.wsgi_app = _wsgi_app_with_setup
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema."""
+    db.ensure_schema()
+
 @app.route('/')
 def index():
     if 'user' in session:
@@ -39,10 +106,8 @@ def login():
         session.permanent = True
         session['user'] = username
         session['role'] = user['role']
-        # Session email setting removed
-        # user_dict = dict(user)
-        # session['email'] = user_dict.get('email')
-        session['chat_history'] = []
+        # Assessment results are emailed to the address set on the profile, if any
+        session['email'] = user['email']
         return redirect(url_for('home'))
             
     return render_template('login.html', error="Invalid username or password")
@@ -147,7 +212,26 @@ def admin():
         except: pass
         preds_list.append(p)
 
-    return render_template('admin.html', user=session['user'], users=users_dict, logs=logs_list, predictions=preds_list)
+    return render_template('admin.html', user=session['user'], users=users_dict, logs=logs_list, predictions=preds_list,
+                           ai_cache=response_cache.stats(), ai=ai_status(), drift=drift.report(predictor),
+                           drift_min_samples=drift.DRIFT_MIN_SAMPLES)
+
+@app.route('/admin/profiles')
+@app.route('/admin/profiles/<profile_id>')
+def admin_profiles(profile_id=None):
+    if 'user' not in session: return redirect(url_for('index'))
+    if session.get('role') != 'admin':
+        return redirect(url_for('home'))
+    
+    if profile_id:
+        profile = profiling.load_profile(profile_id)
+        if not profile: abort(404)
+        if request.args.get('download'):
+            return send_from_directory(os.path.abspath(profiling.PROFILE_DIR), f"{profile['id']}.prof", as_attachment=True)
+        return render_template('admin_profiles.html', user=session['user'], profile=profile)
+    
+    return render_template('admin_profiles.html', user=session['user'], profiles=profiling.list_profiles(),
+                           sample_rate=profiling.PROFILE_SAMPLE_RATE)
 
 # --- Predictor Stages ---
 @app.route('/predictor/lifestyle', methods=['GET', 'POST'])
@@ -196,7 +280,7 @@ def predictor_stage2():
                 'active': session.get('p_active', 1)
             }
             pred, prob = predictor.predict(data)
-            risk = "High" if (pred == 1 or prob > 0.5) else "Low"
+            risk = "High" if prob > RISK_THRESHOLD else "Low"
             suggestion = predictor.get_lifestyle_suggestions(prob)
             result = {'risk': risk, 'prob': round(prob * 100, 1), 'suggestion': suggestion}
             
@@ -207,19 +291,71 @@ def predictor_stage2():
             if user_email:
                 send_risk_alert(user_email, session['user'], result)
             
-            return render_template('predictor_result.html', user=session['user'], result=result)
+            # Where this score sits among people of the same age band and sex
+            percentile = risk_percentile(predictor, prob, data['age'] / 365, data['gender'])
+            # How the most similar people in the reference data actually fared
+            similar = (similar_profiles(predictor, [data]) or [None])[0]
+            # Modifiable factors with the biggest effect, scored in one batch (not logged)
+            scenarios = what_if(predictor, data)
+            
+            return render_template('predictor_result.html', user=session['user'], result=result, percentile=percentile, similar=similar,
+                                   scenarios=scenarios)
         except Exception as e:
             print(f"Error: {e}")
             
     return render_template('predictor_step2.html', user=session['user'])
 
 # --- Profile ---
+def parse_test_row(row):
+    """Prediction row as a dict with decoded result/input_data and a test type; None if malformed"""
+    t = dict(row)
+    try:
+        res_parsed = json.loads(t['result'])
+        if isinstance(res_parsed, str):
+            res_parsed = json.loads(res_parsed) # Handle double encoding
+        t['result'] = res_parsed
+
+        inp_parsed = json.loads(t['input_data'])
+        if isinstance(inp_parsed, str):
+            inp_parsed = json.loads(inp_parsed) # Handle double encoding
+        t['input_data'] = inp_parsed
+
+        t['type'] = 'Clinical' if 'ap_hi' in t['input_data'] else 'Lifestyle'
+        return t
+    except Exception as e:
+        # Skip malformed records
+        print(f"Skipping malformed record ID {t.get('id')}: {e}")
+        return None
+
+def build_risk_trend(user, mode):
+    """
+    Chart labels/values for the risk trend, at most CHART_MAX_POINTS of them.
+    'auto' shows individual assessments while they fit and daily averages beyond that;
+    anything still over budget is downsampled with LTTB, which keeps peaks visible.
+    """
+    rows = db.get_risk_series(user, 'raw' if mode == 'auto' else mode)
+    total = sum(r['n'] for r in rows)
+    if mode == 'auto' and len(rows) > CHART_MAX_POINTS:
+        rows = db.get_risk_series(user, 'daily')
+    if not rows:
+        return [], [], 0, 0
+
+    avg = sum(r['prob'] * r['n'] for r in rows) / total
+    points = lttb([(r['epoch'], r['prob']) for r in rows], CHART_MAX_POINTS)
+    long_range = points[-1][0] - points[0][0] > 300 * 86400
+    fmt = '%b %d, %Y' if long_range else '%b %d'
+    prefix = 'Week of ' if mode == 'weekly' else ''
+    labels = [prefix + datetime.datetime.fromtimestamp(x, datetime.timezone.utc).strftime(fmt) for x, _ in points]
+    return labels, [round(y, 1) for _, y in points], round(avg, 1), total
+
 @app.route('/profile', methods=['GET', 'POST'])
 def profile():
     if 'user' not in session: return redirect(url_for('index'))
     
     user = session['user']
     
+    activity_error = None
+
     # Handle Activity Log or Profile Update
     if request.method == 'POST':
         action = request.form.get('action')
@@ -227,6 +363,7 @@ def profile():
         # Profile Update
         if action == 'update_profile':
             db.update_user_profile(user, request.form)
+            session['email'] = db.get_user(user)['email']
             return redirect(url_for('profile'))
         
         # Activity Log
@@ -234,84 +371,29 @@ def profile():
             activity = request.form.get('activity')
             duration = request.form.get('duration')
             if activity and duration:
-                db.log_activity(user, activity, duration, datetime.datetime.now().strftime("%Y-%m-%d"))
+                try:
+                    tracking.log_activity(user, activity, duration)
+                except ValueError:
+                    activity_error = "Please enter the activity duration in minutes."
             
-    # Fetch User Details & Activities
+    # Fetch User Details & Activity Stats
     user_info = db.get_user_details(user)
-    activities = [dict(row) for row in db.get_user_activity(user)]
-    
-    # Calculate streak (simplified)
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    streak = 0
-    if activities and activities[0]['date'] == today:
-        streak = 1
+    activity = tracking.get_summary(user)
         
-    # Valid recent tests for Profile Summary
-    recent_tests_raw = db.get_user_history(user)
-    recent_tests = []
-    
-    # Data for Profile Risk Chart
-    chart_labels = []
-    chart_data = []
+    # Risk trend: aggregated and downsampled server-side so the page stays small for long histories
+    trend_mode = request.args.get('trend', 'auto')
+    if trend_mode not in TREND_MODES:
+        trend_mode = 'auto'
+    chart_labels, chart_data, chart_avg, total_tests = build_risk_trend(user, trend_mode)
 
-    # Iterate in reverse to show oldest to newest on graph if needed, 
-    # but get_user_history is usually DESC. Let's reverse for chart to be linear time left-to-right.
-    for row in reversed(recent_tests_raw):
-        try:
-            res = json.loads(row['result'])
-            if isinstance(res, str): res = json.loads(res) # Handle double encoding
-            
-            date_str = datetime.datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%b %d')
-            chart_labels.append(date_str)
-            
-            prob = float(res['prob'])
-            # Ensure prob is 0.0-1.0 before scaling, or 0-100 if already scaled
-            # Heuristic: if prob > 1, assume it's already %; if <=1, scale it.
-            # But the stored format is usually 0.XX. 
-            # If user sees 7890, it means prob was 78.9 and we multiplied by 100? Or prob was 7890?
-            
-            # Use safe scaling
-            val = prob * 100 if prob <= 1.0 else prob
-            chart_data.append(val) 
-        except: pass
+    # Most recent tests for the history list; the full list is on /tests
+    recent_tests = [t for t in map(parse_test_row, db.get_user_history(user, limit=PROFILE_HISTORY_ROWS)) if t]
+    highest = db.get_highest_risk_prediction(user)
+    highest_risk_test = parse_test_row(highest) if highest else None
 
-    # Re-fetch for table display (clean order)
-    highest_risk_test = None
-    max_prob = -1.0
-    
-    for row in recent_tests_raw:
-        t = dict(row)
-        try:
-            # Attempt to parse result
-            res_parsed = json.loads(t['result'])
-            if isinstance(res_parsed, str):
-                res_parsed = json.loads(res_parsed) # Handle double encoding
-            t['result'] = res_parsed
-            
-            # Attempt to parse input_data
-            inp_parsed = json.loads(t['input_data'])
-            if isinstance(inp_parsed, str):
-                inp_parsed = json.loads(inp_parsed) # Handle double encoding
-            t['input_data'] = inp_parsed
-            
-            # Determine Test Type
-            if 'ap_hi' in t['input_data']:
-                t['type'] = 'Clinical'
-            else:
-                t['type'] = 'Lifestyle'
-            
-            # Find highest risk
-            if t['result']['prob'] > max_prob:
-                max_prob = t['result']['prob']
-                highest_risk_test = t
-            
-            recent_tests.append(t)
-        except Exception as e:
-             # Skip malformed records
-             print(f"Skipping malformed record ID {t.get('id')}: {e}")
-             pass
-
-    return render_template('profile.html', user=user, user_info=user_info, activities=activities, streak=streak, recent_tests=recent_tests, chart_labels=chart_labels, chart_data=chart_data, highest_risk_test=highest_risk_test)
+    return render_template('profile.html', user=user, user_info=user_info, activity=activity, activity_error=activity_error, recent_tests=recent_tests,
+                           total_tests=total_tests, chart_labels=chart_labels, chart_data=chart_data, chart_avg=chart_avg,
+                           trend_mode=trend_mode, highest_risk_test=highest_risk_test)
 
 @app.route('/tests')
 def tests():
@@ -338,60 +420,114 @@ def insights():
     
     return render_template('insights.html', user=session['user'], stats=stats, models=model_comparison)
 
+def build_chat_context(user):
+    """
+    Profile, latest assessment and recent turns, flattened into one context string for the AI.
+    Also returns the fields the reply is cached on: everything in the context that shapes the
+    answer, including the recent turns, so a cached reply never crosses users or conversations.
+    """
+    history = [{'role': m['role'], 'content': m['content']} for m in db.get_chat_messages(user, limit=3)]
+    
+    # --- Enhanced AI Context ---
+    user_info = db.get_user_details(user)
+    latest_history = db.get_user_history(user)
+    
+    context_parts = [f"User: {user}"]
+    cache_fields = {'user': user}
+    
+    # Add Profile Info
+    if user_info:
+        u = dict(user_info)
+        cache_fields['profile'] = [u.get('dob'), u.get('blood_type'), u.get('chronic_diseases'), u.get('allergies')]
+        context_parts.append(f"Profile: Age={u.get('dob','?')}, Blood={u.get('blood_type','?')}, Conditions={u.get('chronic_diseases','None')}, Allergies={u.get('allergies','None')}")
+    
+    # Add Latest Health Checkup
+    if latest_history:
+        try:
+            last_test = dict(latest_history[0])
+            # Handle double encoding if necessary (reusing simple logic)
+            res = json.loads(last_test['result'])
+            if isinstance(res, str): res = json.loads(res)
+            
+            inp = json.loads(last_test['input_data'])
+            if isinstance(inp, str): inp = json.loads(inp)
+
+            context_parts.append(f"Latest Assessment ({last_test['timestamp']}): Risk={res.get('risk')} ({res.get('prob')}%)")
+            context_parts.append(f"Vitals: BP={inp.get('ap_hi')}/{inp.get('ap_lo')}, Cholesterol level={inp.get('cholesterol')}, Glucose level={inp.get('gluc')}")
+            cache_fields['latest'] = last_test['id']
+        except Exception as e:
+            print(f"Context Build Error: {e}")
+    
+    # Add Recent Chat History
+    context_parts.append(f"Recent Conversation: {history}")
+    cache_fields['conversation'] = history
+    
+    return " | ".join(context_parts), cache_fields
+
+def chat_context(user, prompt):
+    """Context for a chat prompt: none for general FAQs (so their replies are shared), else the user's"""
+    if is_faq(prompt):
+        return "", None
+    return build_chat_context(user)
+
 @app.route('/chat', methods=['GET', 'POST'])
 def chat():
     if 'user' not in session: return redirect(url_for('index'))
     
-    if 'chat_history' not in session:
-        session['chat_history'] = []
+    user = session['user']
         
     if request.method == 'POST':
         prompt = request.form.get('prompt')
         if prompt:
-            history = session['chat_history']
-            history.append({'role': 'user', 'content': prompt})
-            
-            # --- Enhanced AI Context ---
-            user_info = db.get_user_details(session['user'])
-            latest_history = db.get_user_history(session['user'])
-            
-            context_parts = [f"User: {session['user']}"]
-            
-            # Add Profile Info
-            if user_info:
-                u = dict(user_info)
-                context_parts.append(f"Profile: Age={u.get('dob','?')}, Blood={u.get('blood_type','?')}, Conditions={u.get('chronic_diseases','None')}, Allergies={u.get('allergies','None')}")
-            
-            # Add Latest Health Checkup
-            if latest_history:
-                try:
-                    last_test = dict(latest_history[0])
-                    # Handle double encoding if necessary (reusing simple logic)
-                    res = json.loads(last_test['result'])
-                    if isinstance(res, str): res = json.loads(res)
-                    
-                    inp = json.loads(last_test['input_data'])
-                    if isinstance(inp, str): inp = json.loads(inp)
-
-                    context_parts.append(f"Latest Assessment ({last_test['timestamp']}): Risk={res.get('risk')} ({res.get('prob')}%)")
-                    context_parts.append(f"Vitals: BP={inp.get('ap_hi')}/{inp.get('ap_lo')}, Cholesterol level={inp.get('cholesterol')}, Glucose level={inp.get('gluc')}")
-                except Exception as e:
-                    print(f"Context Build Error: {e}")
-            
-            # Add Recent Chat History
-            context_parts.append(f"Recent Conversation: {history[-3:]}")
-            
-            full_context = " | ".join(context_parts)
-            # ---------------------------
+            db.add_chat_message(user, 'user', prompt)
+            full_context, cache_fields = chat_context(user, prompt)
 
-            response = get_ai_response(prompt, full_context)
+            response = get_ai_response(prompt, full_context, cache_fields)
                  
-            history.append({'role': 'assistant', 'content': response})
-            session['chat_history'] = history
+            db.add_chat_message(user, 'assistant', response)
+    
+    # Older turns are paged in on demand via ?before=<message id>
+    before = request.args.get('before', type=int)
+    messages = [dict(m) for m in db.get_chat_messages(user, limit=CHAT_WINDOW, before=before)]
+    older_id = messages[0]['id'] if len(messages) == CHAT_WINDOW else None
             
-    return render_template('chat.html', user=session['user'], messages=session['chat_history'])
+    return render_template('chat.html', user=user, messages=messages, older_id=older_id)
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events variant of /chat: forwards model output chunk by chunk"""
+    if 'user' not in session: return Response(status=401)
+    
+    user = session['user']
+    prompt = request.form.get('prompt')
+    if not prompt: return Response(status=400)
+    
+    db.add_chat_message(user, 'user', prompt)
+    full_context, cache_fields = chat_context(user, prompt)
+    
+    def generate():
+        parts = []
+        try:
+            for chunk in stream_ai_response(prompt, full_context, cache_fields):
+                parts.append(chunk)
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            # Persist whatever was generated, even if the client went away mid-stream
+            if parts:
+                db.add_chat_message(user, 'assistant', ''.join(parts))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus scrape target; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response(status=401)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    db.init_db()
-    db.add_missing_columns()
-    app.run(debug=True, port=5000)
+    setup_app()
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', port=int(os.getenv('PORT', 5000)))
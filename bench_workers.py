@@ -0,0 +1,117 @@
+"""
+Compare gunicorn worker modes under the same load.
+
+Each mode gets a fresh gunicorn (gunicorn.conf.py, temporary DB, stub LLM, no real mail)
+and is driven by loadtest.py; the table shows throughput and tail latency side by side.
+
+    python bench_workers.py --modes sync,gthread,gevent --workers 4 --threads 8 --users 50 --duration 30
+"""
+import os
+import sys
+import json
+import time
+import socket
+import secrets
+import argparse
+import tempfile
+import subprocess
+import http.client
+import importlib.util
+import utils.db as db
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_until_up(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return True
+        except OSError:
+            time.sleep(0.25)
+    return False
+
+def run_mode(mode, args):
+    workdir = tempfile.mkdtemp(prefix=f'heartguard-bench-{mode}-')
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               GUNICORN_WORKER_CLASS=mode,
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(1 if mode == 'sync' else args.threads),
+               GUNICORN_ACCESS_LOG='',
+               DATABASE_PATH=os.path.join(workdir, 'heartguard.db'),
+               RATE_LIMIT_DB=os.path.join(workdir, 'ratelimit.db'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'),
+               PROFILE_DIR=os.path.join(workdir, 'profiles'),
+               AI_BACKEND='fake',
+               AI_FAKE_DELAY=str(args.ai_delay),
+               EMAIL_USER='',
+               EMAIL_PASS='',
+               MAX_CONCURRENT_REQUESTS=str(max(64, args.users * 2)),
+               RATE_LIMITS=','.join(f"{e}=1000000000/1" for e in
+                                    ['login', 'register', 'chat', 'chat_stream', 'predictor_stage1', 'predictor_stage2']))
+    # The admin part of the journey logs in to a pre-created account; loadtest never registers one remotely
+    admin_password = secrets.token_urlsafe(12)
+    db.DB_NAME = env['DATABASE_PATH']
+    db.init_db()
+    db.add_user('admin', admin_password, role='admin')
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_until_up(port):
+            print(f"  {mode}: server did not come up, see {log.name}", file=sys.stderr)
+            return None
+        report = os.path.join(workdir, 'report.json')
+        subprocess.run([sys.executable, 'loadtest.py', '--url', f'http://127.0.0.1:{port}', '--users', str(args.users),
+                        '--duration', str(args.duration), '--think', str(args.think), '--json', report, '--admin-user', 'admin'],
+                       cwd=HERE, env=dict(os.environ, LOADTEST_ADMIN_PASSWORD=admin_password), check=True, stdout=subprocess.DEVNULL)
+        with open(report) as f:
+            return json.load(f)
+    finally:
+        server.terminate()  # SIGTERM: graceful shutdown
+        server.wait(timeout=60)
+        log.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='sync,gthread,gevent', help='Comma-separated gunicorn worker classes')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gthread worker')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--think', type=float, default=0.1)
+    parser.add_argument('--ai-delay', type=float, default=0.02)
+    parser.add_argument('--json', help='Also write the comparison to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in filter(None, (m.strip() for m in args.modes.split(','))):
+        if mode == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print("Skipping gevent: not installed (pip install gevent)", file=sys.stderr)
+            continue
+        print(f"Benchmarking {mode} ...", file=sys.stderr)
+        report = run_mode(mode, args)
+        if report:
+            results[mode] = report
+
+    print(f"\n{'mode':<10}{'workers':>8}{'threads':>8}{'reqs':>9}{'req/s':>9}{'errors':>9}{'worst p99 ms':>14}")
+    for mode, report in results.items():
+        s = report['summary']
+        worst = max((r['p99_ms'] for r in report['routes']), default=0)
+        threads = 1 if mode == 'sync' else args.threads
+        print(f"{mode:<10}{args.workers:>8}{threads:>8}{s['requests']:>9}{s['rps']:>9}{s['error_rate']:>9.2%}{worst:>14}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
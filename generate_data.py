@@ -0,0 +1,243 @@
+"""
+Deterministic synthetic cardio data for scaling tests.
+
+The joint distribution is fitted from the bundled CSV: the categorical columns (gender,
+cholesterol, gluc, smoke, alco, active, cardio) are drawn from their empirical joint
+frequencies, and the continuous columns (age, height, weight, ap_hi, ap_lo) from a
+Gaussian copula fitted separately for each gender/cholesterol/cardio group, so
+correlations such as blood pressure vs. outcome carry over. Rows are produced in
+fixed-size blocks, each seeded from (seed, block number), so the output depends only on
+--seed and --rows and memory stays constant however many rows are written.
+
+    python generate_data.py --rows 10000000 --out synthetic_10m.csv.gz --workers 4
+    python generate_data.py --seed-db /tmp/bench.db --users 100000 --predictions 5000000 --activities 2000000
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DATA_PATH = 'final_cardio_train_data.csv'
+BLOCK_ROWS = 100000
+QUANTILES = 1001
+
+CATEGORICAL = ['gender', 'cholesterol', 'gluc', 'smoke', 'alco', 'active', 'cardio']
+CONTINUOUS = ['age', 'height', 'weight', 'ap_hi', 'ap_lo']
+GROUP_BY = ['gender', 'cholesterol', 'cardio']
+COLUMNS = ['age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo', 'cholesterol', 'gluc', 'smoke', 'alco', 'active', 'cardio']
+
+ACTIVITIES = {'Walking': 0.35, 'Running': 0.15, 'Cycling': 0.12, 'Yoga': 0.12, 'Swimming': 0.08,
+              'Gym': 0.12, 'Dancing': 0.06}
+FIRST_NAMES = ['Aarav', 'Priya', 'John', 'Maria', 'Wei', 'Fatima', 'Liam', 'Sofia', 'Ravi', 'Emma', 'Omar', 'Ana']
+LAST_NAMES = ['Patel', 'Smith', 'Garcia', 'Chen', 'Khan', 'Brown', 'Silva', 'Sharma', 'Müller', 'Kim']
+SEEDED_PASSWORD = 'password'
+
+# --- Fitting ---
+def fit(path=DATA_PATH):
+    """Empirical joint of the categorical columns plus one Gaussian copula per group"""
+    import numpy as np
+    import pandas as pd
+    from scipy.special import ndtri
+
+    df = pd.read_csv(path)
+    cells = df.groupby(CATEGORICAL).size()
+    model = {
+        'cells': np.array(cells.index.tolist(), dtype=np.int64),
+        'cell_probs': (cells / cells.sum()).to_numpy(),
+        'groups': {},
+    }
+    grid = np.linspace(0, 1, QUANTILES)
+    for key, group in df.groupby(GROUP_BY):
+        values = group[CONTINUOUS].to_numpy(dtype=float)
+        # Normal scores of the ranks give the copula correlation, independent of the marginals
+        u = (group[CONTINUOUS].rank().to_numpy() - 0.5) / len(group)
+        corr = np.corrcoef(ndtri(u), rowvar=False) if len(group) > len(CONTINUOUS) else np.eye(len(CONTINUOUS))
+        model['groups'][tuple(int(k) for k in key)] = {
+            'quantiles': np.quantile(values, grid, axis=0),
+            'chol': np.linalg.cholesky(corr + 1e-9 * np.eye(len(CONTINUOUS))),
+        }
+    print(f"[Generate] Fitted {len(cells)} categorical cells and {len(model['groups'])} copulas from {len(df):,} rows",
+          file=sys.stderr)
+    return model
+
+# --- Sampling ---
+def sample(model, n, rng):
+    """`n` synthetic rows as a DataFrame in the bundled CSV's schema (age in years)"""
+    import numpy as np
+    import pandas as pd
+    from scipy.special import ndtr
+
+    cells = model['cells'][rng.choice(len(model['cells']), size=n, p=model['cell_probs'])]
+    df = pd.DataFrame(cells, columns=CATEGORICAL)
+    cont = np.empty((n, len(CONTINUOUS)))
+    keys = df[GROUP_BY].to_numpy()
+    group_ids = keys[:, 0] * 100 + keys[:, 1] * 10 + keys[:, 2]
+    grid = np.linspace(0, 1, QUANTILES)
+    for gid in np.unique(group_ids):
+        rows = np.nonzero(group_ids == gid)[0]
+        key = (int(gid // 100), int(gid // 10 % 10), int(gid % 10))
+        fitted = model['groups'].get(key)
+        if fitted is None:
+            fitted = next(iter(model['groups'].values()))
+        u = ndtr(rng.standard_normal((len(rows), len(CONTINUOUS))) @ fitted['chol'].T)
+        for j in range(len(CONTINUOUS)):
+            cont[rows, j] = np.interp(u[:, j], grid, fitted['quantiles'][:, j])
+    df['age'] = np.round(cont[:, 0] * 365) / 365  # the dataset stores whole days, in years
+    df['height'] = np.round(cont[:, 1]).astype(np.int64)
+    df['weight'] = np.round(cont[:, 2], 1)
+    df['ap_hi'] = np.round(cont[:, 3]).astype(np.int64)
+    df['ap_lo'] = np.round(cont[:, 4]).astype(np.int64)
+    return df[COLUMNS]
+
+def block_rng(seed, block):
+    import numpy as np
+    return np.random.default_rng([seed, block])
+
+_model = None
+
+def _init_worker(model):
+    global _model
+    _model = model
+
+def _csv_block(seed, block, n):
+    return sample(_model, n, block_rng(seed, block)).to_csv(index=False, header=False).encode()
+
+def write_csv(model, rows, out, seed, workers):
+    """Stream `rows` rows to `out` (gzip if it ends in .gz, stdout for '-'), blocks in order"""
+    f = sys.stdout.buffer if out == '-' else gzip.open(out, 'wb', compresslevel=3) if out.endswith('.gz') else open(out, 'wb')
+    f.write((','.join(COLUMNS) + '\n').encode())
+    blocks = [(b, min(BLOCK_ROWS, rows - b * BLOCK_ROWS)) for b in range((rows + BLOCK_ROWS - 1) // BLOCK_ROWS)]
+    started = time.time()
+    written = 0
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+        for block, n in blocks:
+            pending.append((pool.submit(_csv_block, seed, block, n), n))
+            # Bounded read-ahead keeps memory flat regardless of --rows
+            while len(pending) >= workers * 2 or (pending and block == blocks[-1][0]):
+                future, n_done = pending.popleft()
+                f.write(future.result())
+                written += n_done
+                rate = written / max(time.time() - started, 1e-9)
+                print(f"  {written:,}/{rows:,} rows, {rate:,.0f} rows/s", end='\r', file=sys.stderr)
+    if f is not sys.stdout.buffer:
+        f.close()
+    print(f"\n[Generate] Wrote {written:,} rows in {time.time() - started:.1f}s -> {out}", file=sys.stderr)
+
+# --- Database Seeding ---
+def _bulk(conn, sql, rows_iter, label, total):
+    done = 0
+    for rows in rows_iter:
+        conn.executemany(sql, rows)
+        conn.commit()
+        done += len(rows)
+        print(f"  seeded {done:,}/{total:,} {label}", end='\r', file=sys.stderr)
+    print(file=sys.stderr)
+
+def seed_db(model, path, n_users, n_predictions, n_activities, seed, days=3 * 365):
+    """
+    Bulk-insert synthetic users, predictions (inputs from the fitted distribution, scored by
+    the live model) and activity logs. Indexes are dropped during the load and rebuilt after.
+    """
+    import numpy as np
+    import utils.db as db
+    from utils.models import HeartDiseasePredictor, RISK_THRESHOLD
+
+    db.DB_NAME = path
+    db.init_db()
+    conn = db.get_db_connection()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for index in ('idx_predictions_user_time', 'idx_activity_logs_user_date'):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    rng = np.random.default_rng([seed, 1 << 32])
+    usernames = [f"user{i:07d}" for i in range(n_users)]
+    # Usage is long-tailed: a few users run many tests, most run a handful
+    weights = rng.lognormal(0, 1.2, n_users)
+    weights /= weights.sum()
+    now = time.time()
+
+    def users():
+        for start in range(0, n_users, BLOCK_ROWS):
+            rows = []
+            for i in range(start, min(start + BLOCK_ROWS, n_users)):
+                first, last = FIRST_NAMES[rng.integers(len(FIRST_NAMES))], LAST_NAMES[rng.integers(len(LAST_NAMES))]
+                dob = time.strftime('%Y-%m-%d', time.gmtime(now - rng.uniform(30, 65) * 365.25 * 86400))
+                rows.append((usernames[i], f"{usernames[i]}@example.com", SEEDED_PASSWORD, 'user', f"{first} {last}", dob))
+            yield rows
+
+    predictor = HeartDiseasePredictor('.').preload()
+
+    def predictions():
+        for block, start in enumerate(range(0, n_predictions, BLOCK_ROWS)):
+            n = min(BLOCK_ROWS, n_predictions - start)
+            block_random = block_rng(seed, block)
+            df = sample(model, n, block_random).drop(columns='cardio')
+            df['age'] = df['age'] * 365  # the app stores age in days
+            records = df.to_dict('records')
+            df['BMI'] = df['weight'] / (df['height'] / 100) ** 2
+            prob = predictor.predict_proba_batch(df)
+            who = block_random.choice(n_users, size=n, p=weights)
+            stamps = now - block_random.uniform(0, days * 86400, n)
+            rows = []
+            for i in range(n):
+                result = {'risk': 'High' if prob[i] > RISK_THRESHOLD else 'Low', 'prob': round(float(prob[i]) * 100, 1),
+                          'suggestion': predictor.get_lifestyle_suggestions(prob[i])}
+                rows.append((usernames[who[i]], json.dumps(records[i]), json.dumps(result),
+                             time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(stamps[i]))))
+            yield rows
+
+    def activities():
+        names, probs = list(ACTIVITIES), np.array(list(ACTIVITIES.values()))
+        for block, start in enumerate(range(0, n_activities, BLOCK_ROWS)):
+            n = min(BLOCK_ROWS, n_activities - start)
+            block_random = np.random.default_rng([seed, 1 << 33, block])
+            who = block_random.choice(n_users, size=n, p=weights)
+            kind = block_random.choice(len(names), size=n, p=probs / probs.sum())
+            minutes = np.clip(np.round(block_random.lognormal(np.log(30), 0.5, n)), 5, 240).astype(int)
+            stamps = now - block_random.uniform(0, 365 * 86400, n)
+            yield [(usernames[who[i]], names[kind[i]], int(minutes[i]), time.strftime('%Y-%m-%d', time.gmtime(stamps[i])))
+                   for i in range(n)]
+
+    started = time.time()
+    _bulk(conn, "INSERT OR IGNORE INTO users (username, email, password, role, full_name, dob) VALUES (?, ?, ?, ?, ?, ?)",
+          users(), 'users', n_users)
+    if n_users:
+        _bulk(conn, "INSERT INTO predictions (username, input_data, result, timestamp) VALUES (?, ?, ?, ?)",
+              predictions(), 'predictions', n_predictions)
+        _bulk(conn, "INSERT INTO activity_logs (username, activity, duration, date) VALUES (?, ?, ?, ?)",
+              activities(), 'activity logs', n_activities)
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.close()
+    db.init_db()  # recreates the dropped indexes
+    print(f"[Generate] Seeded {path} in {time.time() - started:.1f}s (seeded users log in with '{SEEDED_PASSWORD}')",
+          file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--source', default=DATA_PATH, help='CSV to fit the distributions from')
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows of cardio data to write to --out')
+    parser.add_argument('--out', help="Output CSV ('.gz' for gzip, '-' for stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed-db', metavar='PATH', help='SQLite database to fill with users, predictions and activity logs')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--predictions', type=int, default=1000000)
+    parser.add_argument('--activities', type=int, default=1000000)
+    args = parser.parse_args()
+    if not args.out and not args.seed_db:
+        parser.error('nothing to do: give --out and/or --seed-db')
+
+    model = fit(args.source)
+    if args.out:
+        write_csv(model, args.rows, args.out, args.seed, args.workers)
+    if args.seed_db:
+        seed_db(model, args.seed_db, args.users, args.predictions, args.activities, args.seed)
+
+if __name__ == '__main__':
+    main()
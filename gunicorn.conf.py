@@ -0,0 +1,88 @@
+"""
+Production serving config: gunicorn -c gunicorn.conf.py wsgi:app
+
+The app and ML models are loaded once in the master and shared copy-on-write with the
+workers. Chat and email are I/O bound, so the default worker class is gthread; set
+GUNICORN_WORKER_CLASS=gevent (pip install gevent) for many slow streaming clients.
+"""
+import os
+import gc
+import shutil
+import tempfile
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU pinning
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# --- Workers ---
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', _cores() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))  # gevent only
+preload_app = True
+
+# --- Timeouts ---
+# Streamed chat replies can take a while; AI_TIMEOUT bounds each LLM call well below this
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None  # empty disables it
+
+# --- Shared State Between Workers ---
+# Must be set before the app is imported: metrics are merged from per-worker snapshots
+# and rate-limit buckets live in a shared SQLite file instead of per-process memory.
+# /metrics serves whatever is in METRICS_DIR, so the default is a fresh 0700 directory.
+if 'METRICS_DIR' not in os.environ:
+    os.environ['METRICS_DIR'] = os.environ['HEARTGUARD_TMP_METRICS_DIR'] = tempfile.mkdtemp(prefix='heartguard-metrics-')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'sqlite')
+
+# --- Hooks ---
+def on_starting(server):
+    """Master, once, before any worker is forked"""
+    import app
+    import utils.db as db
+    import utils.assets as assets
+    import utils.metrics as metrics
+    import utils.percentiles as percentiles
+    import utils.neighbors as neighbors
+    import utils.drift as drift
+
+    db.ensure_schema()
+    metrics.clear_snapshots()
+    app.predictor.preload()
+    percentiles.get_index(app.predictor)
+    neighbors.get_index(app.predictor)
+    app.predictor.evaluate_models()
+    drift.get_baseline(app.predictor)
+    assets.warm_templates(app.app)
+    # Keep the objects loaded so far out of GC bookkeeping so workers don't dirty their pages
+    gc.freeze()
+    server.log.info("[Startup] Master ready: %s x %s workers", workers, worker_class)
+
+def post_worker_init(worker):
+    """Each worker, after fork: start its background threads before taking traffic"""
+    import app
+    app.setup_app()
+
+def worker_exit(server, worker):
+    """Worker, on a graceful exit: record what it counted since the last flush"""
+    from utils import metrics
+    metrics.write_snapshot()
+    server.log.info("[Shutdown] Worker %s exited", worker.pid)
+
+def child_exit(server, worker):
+    """Master, for every exited worker (crashed ones too)"""
+    from utils import metrics
+    # Its gauges leave /metrics; its counters stay in the totals
+    metrics.retire_snapshot(worker.pid)
+
+def on_exit(server):
+    # Only the directory created above; an explicit METRICS_DIR is left alone
+    if os.getenv('HEARTGUARD_TMP_METRICS_DIR'):
+        shutil.rmtree(os.environ['HEARTGUARD_TMP_METRICS_DIR'], ignore_errors=True)
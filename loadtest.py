@@ -0,0 +1,300 @@
+"""
+End-to-end load test for HeartGuard.
+
+Starts the real Flask app on a temporary database (LLM and SMTP replaced by local stubs)
+and drives it with concurrent virtual users walking the full journey:
+register/login (-> profile email) -> lifestyle -> clinical -> profile -> tests -> chat (-> admin).
+Locally every VU sets a profile email, so each assessment also goes through the mail queue
+to the SMTP stub; against --url no email is set, so a real server never sends mail.
+
+    python loadtest.py --users 50 --duration 60 --think 0.5 --seed-predictions 1000000
+    python loadtest.py --url http://127.0.0.1:8000 --users 100   # against an already running server
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import socketserver
+import http.client
+import urllib.parse
+from collections import defaultdict
+
+# --- Local Stubs ---
+class SmtpSink(socketserver.StreamRequestHandler):
+    """Accepts and discards mail: just enough SMTP for smtplib"""
+    received = 0
+
+    def handle(self):
+        self.wfile.write(b"220 loadtest ESMTP\r\n")
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    SmtpSink.received += 1
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            cmd = line[:4].upper()
+            if cmd == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+def start_smtp_sink():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SmtpSink)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+def seed_predictions(db_module, usernames, count, batch=50000):
+    """Bulk-insert `count` historical predictions spread over `usernames` and the past ~3 years"""
+    conn = db_module.get_db_connection()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    rng = random.Random(42)
+    now = time.time()
+    done = 0
+    while done < count:
+        rows = []
+        for _ in range(min(batch, count - done)):
+            prob = rng.random()
+            inp = {'age': rng.randint(30, 65) * 365, 'gender': rng.randint(1, 2), 'height': rng.randint(150, 190),
+                   'weight': rng.randint(50, 110), 'ap_hi': rng.randint(100, 170), 'ap_lo': rng.randint(60, 100),
+                   'cholesterol': rng.randint(1, 3), 'gluc': rng.randint(1, 3), 'smoke': rng.randint(0, 1),
+                   'alco': rng.randint(0, 1), 'active': rng.randint(0, 1)}
+            res = {'risk': 'High' if prob > 0.5 else 'Low', 'prob': round(prob * 100, 1), 'suggestion': 'Seeded record'}
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - rng.random() * 3 * 365 * 86400))
+            rows.append((rng.choice(usernames), json.dumps(inp), json.dumps(res), ts))
+        conn.executemany("INSERT INTO predictions (username, input_data, result, timestamp) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        done += len(rows)
+        print(f"  seeded {done:,}/{count:,} predictions", end='\r', file=sys.stderr)
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.close()
+    print(file=sys.stderr)
+
+def start_local_app(args):
+    """Import the app against a temporary DB with stubbed LLM/SMTP and serve it on an ephemeral port"""
+    workdir = tempfile.mkdtemp(prefix='heartguard-load-')
+    # Never the real LLM, even if AI_BACKEND is set in the environment: it would spend quota
+    os.environ['AI_BACKEND'] = 'fake'
+    os.environ['AI_FAKE_DELAY'] = str(args.ai_delay)
+    os.environ['EMAIL_SERVER'] = '127.0.0.1'
+    os.environ['EMAIL_PORT'] = str(start_smtp_sink())
+    os.environ['EMAIL_USER'] = 'loadtest@localhost'
+    os.environ['EMAIL_PASS'] = 'loadtest'
+    os.environ['PROFILE_DIR'] = os.path.join(workdir, 'profiles')
+    # The point is to find the app's limits, not the rate limiter's
+    os.environ.setdefault('RATE_LIMITS', ','.join(f"{e}=1000000000/1" for e in
+                                                  ['login', 'register', 'chat', 'chat_stream', 'predictor_stage1', 'predictor_stage2']))
+    os.environ.setdefault('MAX_CONCURRENT_REQUESTS', str(max(64, args.users * 2)))
+
+    import utils.db as db
+    db.DB_NAME = os.path.join(workdir, 'heartguard.db')
+    db.init_db()
+    if args.seed_predictions:
+        seed_users = [f"seed{i}" for i in range(args.seed_users)] + [f"vu{i}" for i in range(args.users)]
+        seed_predictions(db, seed_users, args.seed_predictions)
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import app as heartguard
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, heartguard.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"App serving from {workdir} on port {server.server_port}", file=sys.stderr)
+    return f"http://127.0.0.1:{server.server_port}"
+
+# --- Virtual Users ---
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+
+    def record(self, route, seconds, status):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if status == 429:
+                self.throttled[route] += 1
+            elif status is None or status >= 400:
+                self.errors[route] += 1
+
+class VirtualUser:
+    def __init__(self, base_url, username, stats, think):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.conn = None
+        self.cookie = None
+        self.username = username
+        self.stats = stats
+        self.think = think
+
+    def request(self, route, method, path, form=None):
+        body = urllib.parse.urlencode(form).encode() if form else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        start = time.perf_counter()
+        status = None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+            status = resp.status
+            set_cookie = resp.getheader('Set-Cookie')
+            if set_cookie:
+                self.cookie = set_cookie.split(';', 1)[0]
+        except Exception:
+            # Drop the connection; the next request reconnects
+            if self.conn:
+                self.conn.close()
+            self.conn = None
+        self.stats.record(route, time.perf_counter() - start, status)
+        if self.think:
+            time.sleep(random.uniform(0, 2 * self.think))
+        return status
+
+    def sign_in(self, password='loadtest', register=True):
+        status = None
+        if register:
+            status = self.request('POST /register', 'POST', '/register',
+                                  {'username': self.username, 'password': password, 'confirm_password': password})
+        if status != 302:
+            self.request('POST /login', 'POST', '/login', {'username': self.username, 'password': password})
+
+    def set_email(self):
+        """Give the account an address so every assessment queues a results email"""
+        self.request('POST /profile', 'POST', '/profile', {
+            'action': 'update_profile', 'full_name': self.username, 'email': f"{self.username}@loadtest.invalid"})
+
+    def journey(self, is_admin=False):
+        age = random.randint(30, 70)
+        self.request('GET /predictor/lifestyle', 'GET', '/predictor/lifestyle')
+        self.request('POST /predictor/lifestyle', 'POST', '/predictor/lifestyle', {
+            'age': age, 'weight': random.randint(55, 110), 'height': random.randint(150, 195),
+            'smoke': 'on', 'active': random.choice(['on', ''])})
+        self.request('POST /predictor/clinical', 'POST', '/predictor/clinical', {
+            'gender': random.randint(1, 2), 'ap_hi': random.randint(100, 180), 'ap_lo': random.randint(60, 110),
+            'cholesterol': random.randint(1, 3), 'gluc': random.randint(1, 3)})
+        self.request('GET /profile', 'GET', '/profile')
+        self.request('GET /tests', 'GET', '/tests')
+        self.request('POST /chat', 'POST', '/chat', {'prompt': random.choice([
+            'What is a healthy blood pressure?', 'How can I lower my cholesterol?', 'Is my risk high?',
+            f'Explain my latest result number {random.randint(1, 1000)}'])})
+        if is_admin:
+            self.request('GET /admin', 'GET', '/admin')
+
+def run(base_url, args):
+    stats = Stats()
+    stop_at = time.time() + args.duration
+    run_id = random.randint(1000, 9999)
+
+    def vu_main(i):
+        if args.url:
+            # Never register anything privileged on a real server: every VU gets a fresh, unique
+            # user; the admin journey only runs when an existing admin account is passed in
+            is_admin = i == 0 and bool(args.admin_user)
+            name = args.admin_user if is_admin else f"vu{i}_{run_id}"
+        else:
+            # Temporary local DB: vu<i> so seeded history lands on these users; 'admin' gets the admin role
+            is_admin = i == 0
+            name = 'admin' if is_admin else f"vu{i}"
+        vu = VirtualUser(base_url, name, stats, args.think)
+        if is_admin and args.url:
+            vu.sign_in(password=args.admin_password, register=False)
+        else:
+            vu.sign_in()
+        if not args.url:
+            vu.set_email()
+        while time.time() < stop_at:
+            vu.journey(is_admin=is_admin)
+
+    threads = [threading.Thread(target=vu_main, args=(i,), daemon=True) for i in range(args.users)]
+    started = time.time()
+    for t in threads:
+        t.start()
+        time.sleep(args.ramp / max(args.users, 1))
+    for t in threads:
+        t.join()
+    return stats, time.time() - started
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def report(stats, elapsed):
+    rows = []
+    total = errors = 0
+    for route in sorted(stats.latencies):
+        values = sorted(stats.latencies[route])
+        total += len(values)
+        errors += stats.errors[route]
+        rows.append({
+            'route': route, 'requests': len(values), 'rps': round(len(values) / elapsed, 1),
+            'errors': stats.errors[route], 'throttled': stats.throttled[route],
+            'error_rate': round(stats.errors[route] / len(values), 4),
+            'p50_ms': round(percentile(values, 50) * 1000, 1), 'p90_ms': round(percentile(values, 90) * 1000, 1),
+            'p99_ms': round(percentile(values, 99) * 1000, 1), 'max_ms': round(values[-1] * 1000, 1),
+        })
+    summary = {'elapsed_s': round(elapsed, 1), 'requests': total, 'rps': round(total / elapsed, 1),
+               'error_rate': round(errors / total, 4) if total else 0.0}
+    return summary, rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--think', type=float, default=0.2, help='Mean think time between requests (s)')
+    parser.add_argument('--ramp', type=float, default=2, help='Seconds over which users start')
+    parser.add_argument('--ai-delay', type=float, default=0.02, help='Per-word delay of the stub LLM (s)')
+    parser.add_argument('--seed-predictions', type=int, default=0, help='Historical predictions to pre-seed')
+    parser.add_argument('--seed-users', type=int, default=1000, help='Extra users the seeded history is spread over')
+    parser.add_argument('--admin-user', help='With --url: existing admin account for the /admin part of the journey')
+    parser.add_argument('--admin-password', default=os.getenv('LOADTEST_ADMIN_PASSWORD'),
+                        help='Password for --admin-user (default: $LOADTEST_ADMIN_PASSWORD)')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+    if args.admin_user and not args.admin_password:
+        parser.error('--admin-user needs --admin-password (or LOADTEST_ADMIN_PASSWORD)')
+
+    base_url = args.url or start_local_app(args)
+    stats, elapsed = run(base_url, args)
+    summary, rows = report(stats, elapsed)
+    if not args.url:
+        from utils.mailer import get_queue_stats
+        summary['emails_delivered'] = SmtpSink.received
+        summary['email_queue'] = get_queue_stats()
+
+    print(f"\n{summary['requests']:,} requests in {summary['elapsed_s']}s "
+          f"= {summary['rps']} req/s, error rate {summary['error_rate']:.2%}")
+    if 'emails_delivered' in summary:
+        print(f"{summary['emails_delivered']:,} emails delivered to the SMTP stub, queue: {summary['email_queue']}")
+    print()
+    print(f"{'route':<28}{'reqs':>8}{'rps':>8}{'err':>6}{'429':>6}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for r in rows:
+        print(f"{r['route']:<28}{r['requests']:>8}{r['rps']:>8}{r['errors']:>6}{r['throttled']:>6}"
+              f"{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'routes': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Offline batch scoring of large cardio-schema CSV files.
+
+Streams the input in chunks, scores them on a process pool (each worker loads the models
+once) and writes risk, probability, suggestion and model version in input order. Progress
+is checkpointed after every chunk, so an interrupted run continues where it stopped.
+
+    python score_batch.py screening.csv scored.csv --workers 4 --chunksize 50000
+    python score_batch.py screening.csv scored_parquet/ --format parquet     # needs pyarrow
+    python score_batch.py screening.csv scored.csv --restart                 # ignore the checkpoint
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+INPUT_COLUMNS = ['age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo', 'cholesterol', 'gluc', 'smoke', 'alco', 'active']
+
+_predictor = None
+
+def _init_worker(model_dir):
+    global _predictor
+    from utils.models import HeartDiseasePredictor
+    _predictor = HeartDiseasePredictor(model_dir).preload()
+
+def score_chunk(chunk, age_unit, id_column):
+    """Score one input chunk; rows with missing or non-numeric inputs get empty outputs"""
+    import numpy as np
+    import pandas as pd
+    from utils.models import RISK_THRESHOLD
+
+    X = chunk[INPUT_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    if age_unit == 'years':
+        X['age'] = X['age'] * 365
+    X['BMI'] = X['weight'] / ((X['height'] / 100) ** 2)
+    valid = X.notna().all(axis=1).to_numpy() & (X['height'] > 0).to_numpy()
+
+    prob = np.full(len(X), np.nan)
+    if valid.any():
+        prob[valid] = _predictor.predict_proba_batch(X[valid])
+
+    out = pd.DataFrame({'row': chunk.index.to_numpy()})
+    if id_column:
+        out[id_column] = chunk[id_column].to_numpy()
+    out['risk'] = np.where(~valid, '', np.where(prob > RISK_THRESHOLD, 'High', 'Low'))
+    out['prob'] = np.round(prob * 100, 1)
+    # Same bands as HeartDiseasePredictor.get_lifestyle_suggestions, vectorized
+    out['suggestion'] = np.select(
+        [~valid, prob < 0.3, prob < 0.7],
+        ['', _predictor.get_lifestyle_suggestions(0.0), _predictor.get_lifestyle_suggestions(0.5)],
+        default=_predictor.get_lifestyle_suggestions(1.0))
+    out['model_version'] = _predictor.model_version()
+    return out
+
+# --- Checkpointing ---
+def _checkpoint_path(output):
+    return output.rstrip('/') + '.progress.json'
+
+def load_checkpoint(args):
+    path = _checkpoint_path(args.output)
+    if args.restart or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state['input'] != os.path.abspath(args.input) or state['format'] != args.format:
+        sys.exit(f"{path} belongs to a different run; use --restart to start over")
+    if not _output_intact(args, state):
+        sys.exit(f"{args.output} is missing or shorter than {path} records, so it cannot be resumed; "
+                 f"use --restart to start over")
+    return state
+
+def _output_intact(args, state):
+    """Everything the checkpoint says was written is still there"""
+    if args.format == 'parquet':
+        return all(os.path.exists(os.path.join(args.output, f"part-{part:06d}.parquet"))
+                   for part in range(state['chunks']))
+    return os.path.isfile(args.output) and os.path.getsize(args.output) >= state['bytes']
+
+def save_checkpoint(args, state):
+    path = _checkpoint_path(args.output)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+# --- Output Writers ---
+class CsvWriter:
+    """Appends to one CSV; on resume, anything written after the last checkpoint is cut off"""
+    def __init__(self, path, state):
+        self.path = path
+        if state:
+            with open(path, 'r+b') as f:
+                f.truncate(state['bytes'])
+            self.f = open(path, 'a', newline='')
+            self.header = False
+        else:
+            self.f = open(path, 'w', newline='')
+            self.header = True
+
+    def write(self, df, part):
+        df.to_csv(self.f, header=self.header, index=False)
+        self.header = False
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def position(self):
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+class ParquetWriter:
+    """One part file per chunk in the output directory (a standard Parquet dataset layout)"""
+    def __init__(self, path, state):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # Parts from an earlier run (or written after the last checkpoint) would add stale rows
+        keep = state['chunks'] if state else 0
+        for name in os.listdir(path):
+            stem = name.split('.', 1)[0]
+            if (name.endswith(('.parquet', '.parquet.tmp')) and stem.startswith('part-')
+                    and stem[5:].isdigit() and int(stem[5:]) >= keep):
+                os.remove(os.path.join(path, name))
+
+    def write(self, df, part):
+        final = os.path.join(self.path, f"part-{part:06d}.parquet")
+        df.to_parquet(final + '.tmp', index=False)
+        os.replace(final + '.tmp', final)
+
+    def position(self):
+        return 0
+
+    def close(self):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV with columns ' + ', '.join(INPUT_COLUMNS))
+    parser.add_argument('output', help='Output CSV file, or directory for --format parquet')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunksize', type=int, default=50000, help='Rows per chunk (and per checkpoint)')
+    parser.add_argument('--age-unit', choices=['years', 'days'], default='years',
+                        help='Unit of the age column (the bundled dataset uses years)')
+    parser.add_argument('--id-column', help='Input column to copy to the output next to the row number')
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    import pandas as pd
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("--format parquet needs pyarrow (pip install pyarrow)")
+
+    state = load_checkpoint(args)
+    if state and state.get('finished'):
+        print(f"{args.output} is already complete ({state['rows']:,} rows); use --restart to score again")
+        return
+    start_chunk = state['chunks'] if state else 0
+    rows_done = state['rows'] if state else 0
+    if state and state['chunksize'] != args.chunksize:
+        args.chunksize = state['chunksize']  # chunk numbering must match the checkpoint
+    if state:
+        print(f"Resuming after {rows_done:,} rows ({start_chunk} chunks)", file=sys.stderr)
+
+    usecols = INPUT_COLUMNS + ([args.id_column] if args.id_column else [])
+    # A callable, not a range: pandas turns list-likes into a set, which would grow with the rows skipped
+    reader = pd.read_csv(args.input, usecols=usecols, chunksize=args.chunksize,
+                         skiprows=(lambda i: 0 < i <= rows_done) if rows_done else None)
+    writer = (ParquetWriter if args.format == 'parquet' else CsvWriter)(args.output, state)
+
+    started = time.time()
+    scored = 0
+    part = start_chunk
+    pending = deque()
+
+    def checkpoint(**extra):
+        save_checkpoint(args, {'input': os.path.abspath(args.input), 'format': args.format,
+                               'chunksize': args.chunksize, 'chunks': part, 'rows': rows_done + scored,
+                               'bytes': writer.position(), **extra})
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.model_dir,)) as pool:
+        def drain(block):
+            nonlocal scored, part
+            # Results are written strictly in submission order
+            while pending and (block or pending[0].done()):
+                out = pending.popleft().result()
+                writer.write(out, part)
+                part += 1
+                scored += len(out)
+                checkpoint()
+                rate = scored / max(time.time() - started, 1e-9)
+                print(f"  {rows_done + scored:,} rows scored, {rate:,.0f} rows/s", end='\r', file=sys.stderr)
+                if block:
+                    return
+
+        for i, chunk in enumerate(reader):
+            chunk.index = range(rows_done + i * args.chunksize, rows_done + i * args.chunksize + len(chunk))
+            pending.append(pool.submit(score_chunk, chunk, args.age_unit, args.id_column))
+            # Bounded read-ahead keeps memory flat regardless of input size
+            while len(pending) >= args.workers * 2:
+                drain(block=True)
+            drain(block=False)
+        while pending:
+            drain(block=True)
+
+    checkpoint(finished=True)
+    writer.close()
+    elapsed = time.time() - started
+    print(f"\nScored {scored:,} rows in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}",
+          file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
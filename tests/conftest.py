@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Configuration is read at import time, so it has to be in place before the app is imported
+os.environ.setdefault('AI_BACKEND', 'fake')
+os.environ.setdefault('AI_FAKE_DELAY', '0')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='heartguard-test-'), 'heartguard.db'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import utils.db as db
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Fresh SQLite database for one test"""
+    monkeypatch.setattr(db, 'DB_NAME', str(tmp_path / 'heartguard.db'))
+    db.init_db()
+    return db.DB_NAME
@@ -0,0 +1,120 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import utils.services as services
+from utils.resilience import CircuitBreaker
+from utils.response_cache import ResponseCache
+
+pytest.importorskip('google.genai')
+
+class StubApi(BaseHTTPRequestHandler):
+    """Local stand-in for the Gemini REST API: model listing, generate and streamed generate"""
+    protocol_version = 'HTTP/1.1'
+    models = []
+    fail_listing = False
+    calls = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, obj, content_type='application/json'):
+        body = obj if isinstance(obj, bytes) else json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        StubApi.calls.append(('GET', self.path))
+        if StubApi.fail_listing:
+            self._send(500, {'error': {'code': 500, 'message': 'listing down', 'status': 'INTERNAL'}})
+        else:
+            self._send(200, {'models': [{'name': name} for name in StubApi.models]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        StubApi.calls.append(('POST', self.path))
+        if 'streamGenerateContent' in self.path:
+            events = [json.dumps({'candidates': [{'content': {'parts': [{'text': word}], 'role': 'model'}}]})
+                      for word in ['Hi ', 'there']]
+            self._send(200, b''.join(f"data: {e}\r\n\r\n".encode() for e in events), 'text/event-stream')
+        else:
+            self._send(200, {'candidates': [{'content': {'parts': [{'text': 'stub reply'}], 'role': 'model'}}]})
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    StubApi.models = ['models/gemini-pro', 'models/gemini-9-flash']
+    StubApi.fail_listing = False
+    StubApi.calls = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.setattr(services, 'AI_BACKEND', 'gemini')
+    monkeypatch.setattr(services, 'AI_MODEL', None)
+    monkeypatch.setattr(services, 'AI_BASE_URL', f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(services, '_client', None)
+    monkeypatch.setattr(services, '_model_cache', {'name': None, 'expires': 0.0, 'refreshing': False})
+    monkeypatch.setattr(services, 'ai_breaker', CircuitBreaker())
+    monkeypatch.setattr(services, 'response_cache', ResponseCache(max_entries=16))
+    yield StubApi
+    server.shutdown()
+    server.server_close()
+
+def _listings():
+    return [path for method, path in StubApi.calls if method == 'GET']
+
+def _generated_models():
+    return [path.split('/models/', 1)[1].split(':')[0] for method, path in StubApi.calls if method == 'POST']
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_calls_go_to_the_base_url_override(stub_api):
+    assert services.get_ai_response('What is LDL?') == 'stub reply'
+    assert _listings() and _generated_models() == ['gemini-9-flash']
+
+def test_stream_goes_to_the_base_url_override(stub_api):
+    assert list(services.stream_ai_response('What is LDL?')) == ['Hi ', 'there']
+
+def test_flash_is_preferred_then_pro(stub_api):
+    client = services._get_client()
+    assert services._discover_model(client) == 'models/gemini-9-flash'
+    stub_api.models = ['models/gemini-legacy-flash', 'models/gemini-2-pro', 'models/other']
+    assert services._discover_model(client) == 'models/gemini-2-pro'
+    stub_api.models = ['models/other']
+    assert services._discover_model(client) == 'models/other'
+
+def test_failed_listing_falls_back_and_retries_soon(stub_api, monkeypatch):
+    monkeypatch.setattr(services, 'AI_MODEL_TTL', 3600)
+    stub_api.fail_listing = True
+    assert services._select_model(services._get_client()) == services.DEFAULT_MODEL
+    assert services._model_cache['expires'] - time.time() <= 60
+
+def test_model_is_cached_for_the_ttl_and_refreshed_in_background(stub_api, monkeypatch):
+    monkeypatch.setattr(services, 'AI_MODEL_TTL', 3600)
+    client = services._get_client()
+    assert services._select_model(client) == 'models/gemini-9-flash'
+    assert services._select_model(client) == 'models/gemini-9-flash'
+    assert len(_listings()) == 1
+
+    # Once stale, the cached name is still served while a refresh runs in the background
+    stub_api.models = ['models/gemini-10-flash']
+    services._model_cache['expires'] = 0.0
+    assert services._select_model(client) == 'models/gemini-9-flash'
+    assert _wait_for(lambda: services._model_cache['name'] == 'models/gemini-10-flash')
+    assert len(_listings()) == 2
+
+def test_pinned_model_skips_discovery(stub_api, monkeypatch):
+    monkeypatch.setattr(services, 'AI_MODEL', 'gemini-pinned')
+    assert services.get_ai_response('What is LDL?') == 'stub reply'
+    assert _listings() == []
+    assert _generated_models() == ['gemini-pinned']
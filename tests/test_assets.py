@@ -0,0 +1,30 @@
+import os
+import stat
+from jinja2 import FileSystemBytecodeCache
+import utils.assets as assets
+
+def test_default_uses_jinja_private_cache_dir(monkeypatch):
+    monkeypatch.setattr(assets, 'JINJA_CACHE_DIR', None)
+    cache = assets._bytecode_cache()
+    assert isinstance(cache, FileSystemBytecodeCache)
+    st = os.stat(cache.directory)
+    assert st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) == 0o700
+
+def test_configured_dir_is_created_private(tmp_path, monkeypatch):
+    path = tmp_path / 'jinja'
+    monkeypatch.setattr(assets, 'JINJA_CACHE_DIR', str(path))
+    assert assets._bytecode_cache().directory == str(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+
+def test_writable_by_others_is_refused(tmp_path, monkeypatch):
+    path = tmp_path / 'jinja'
+    path.mkdir()
+    path.chmod(0o777)
+    monkeypatch.setattr(assets, 'JINJA_CACHE_DIR', str(path))
+    assert assets._bytecode_cache() is None
+
+def test_symlink_is_refused(tmp_path, monkeypatch):
+    (tmp_path / 'elsewhere').mkdir(mode=0o700)
+    os.symlink(tmp_path / 'elsewhere', tmp_path / 'jinja')
+    monkeypatch.setattr(assets, 'JINJA_CACHE_DIR', str(tmp_path / 'jinja'))
+    assert assets._bytecode_cache() is None
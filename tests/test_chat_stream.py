@@ -0,0 +1,87 @@
+import json
+import pytest
+import utils.db as db
+import utils.services as services
+from utils.resilience import CircuitBreaker
+from utils.response_cache import ResponseCache
+import app as app_module
+from app import app
+
+PROMPT = 'What is a healthy blood pressure?'
+
+@pytest.fixture
+def client(temp_db, monkeypatch):
+    monkeypatch.setattr(services, 'AI_BACKEND', 'fake')
+    monkeypatch.setattr(services, 'AI_FAKE_DELAY', 0)
+    monkeypatch.setattr(services, 'ai_breaker', CircuitBreaker())
+    monkeypatch.setattr(services, 'response_cache', ResponseCache(max_entries=16))
+    # temp_db already built the schema; keep the mail/session background threads out of the tests
+    monkeypatch.setattr(app_module, '_setup_done', True)
+    client = app.test_client()
+    client.post('/register', data={'username': 'alice', 'password': 'pw', 'confirm_password': 'pw'})
+    return client
+
+def _events(body):
+    """SSE body -> list of (event, data) in order"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return events
+
+def _expected_words(prompt):
+    return list(services._fake_stream(prompt))
+
+def _stored(role):
+    return [m['content'] for m in db.get_chat_messages('alice') if m['role'] == role]
+
+def test_chunks_arrive_in_order_and_end_with_done(client):
+    response = client.post('/chat/stream', data={'prompt': PROMPT})
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response.get_data(as_text=True))
+
+    assert [data['delta'] for kind, data in events[:-1]] == _expected_words(PROMPT)
+    assert events[-1] == ('done', {})
+
+def test_reply_is_persisted(client):
+    client.post('/chat/stream', data={'prompt': PROMPT}).get_data()
+    assert _stored('user') == [PROMPT]
+    assert _stored('assistant') == [''.join(_expected_words(PROMPT))]
+
+def test_error_before_any_chunk_yields_error_message_as_final_chunk(client, monkeypatch):
+    def failing(prompt):
+        raise RuntimeError('upstream down')
+        yield
+
+    monkeypatch.setattr(services, '_fake_stream', failing)
+    events = _events(client.post('/chat/stream', data={'prompt': PROMPT}).get_data(as_text=True))
+
+    assert events == [('message', {'delta': services.ERROR_MESSAGE}), ('done', {})]
+    assert _stored('assistant') == [services.ERROR_MESSAGE]
+    assert services.ai_breaker.failures == 1
+
+def test_error_mid_stream_keeps_the_partial_reply(client, monkeypatch):
+    def failing(prompt):
+        yield 'Partial '
+        raise RuntimeError('connection reset')
+
+    monkeypatch.setattr(services, '_fake_stream', failing)
+    events = _events(client.post('/chat/stream', data={'prompt': PROMPT}).get_data(as_text=True))
+
+    assert events == [('message', {'delta': 'Partial '}), ('done', {})]
+    assert _stored('assistant') == ['Partial ']
+
+def test_client_disconnect_persists_partial_reply_and_frees_the_breaker(client):
+    # A tripped breaker: this request is its half-open trial
+    services.ai_breaker.failure_threshold = 1
+    services.ai_breaker.reset_timeout = 0
+    services.ai_breaker.record_failure()
+
+    response = client.post('/chat/stream', data={'prompt': PROMPT}, buffered=False)
+    stream = iter(response.response)
+    first = next(stream)
+    response.close()  # the client went away
+
+    assert b'delta' in first
+    assert _stored('assistant') == [_expected_words(PROMPT)[0]]
+    assert services.ai_breaker.allow()
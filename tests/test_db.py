@@ -0,0 +1,10 @@
+import json
+import utils.db as db
+
+def test_highest_risk_compares_old_fractional_and_percentage_probs(temp_db):
+    db.log_prediction('alice', {}, {'prob': 50.0, 'risk': 'Moderate'})
+    db.log_prediction('alice', {}, {'prob': 0.9, 'risk': 'High'})  # older rows stored 0-1
+    db.log_prediction('alice', {}, {'prob': 75.0, 'risk': 'High'})
+
+    highest = db.get_highest_risk_prediction('alice')
+    assert json.loads(highest['result'])['prob'] == 0.9
@@ -0,0 +1,74 @@
+import os
+import random
+import pytest
+import utils.db as db
+import utils.drift as drift
+from utils.drift import FeatureStats
+from utils.models import HeartDiseasePredictor, FEATURES
+
+BASELINE = {'source': 'test', 'n': 4, 'features': {
+    'ap_hi': {'edges': [120.0, 140.0], 'probs': [0.25, 0.5, 0.25], 'mean': 130.0, 'std': 15.0},
+    'BMI': {'edges': [25.0], 'probs': [0.5, 0.5], 'mean': 25.0, 'std': 4.0},
+}}
+
+class StubPredictor:
+    data_path = __file__
+
+@pytest.fixture
+def drift_state(temp_db, monkeypatch):
+    monkeypatch.setattr(drift, '_baseline', BASELINE)
+    monkeypatch.setattr(drift, '_delta', {})
+    return drift
+
+def _stored():
+    conn = db.get_db_connection()
+    rows = {r['feature']: dict(r) for r in conn.execute("SELECT * FROM drift_stats")}
+    conn.close()
+    return rows
+
+def test_merged_stats_match_a_single_pass():
+    values = [random.gauss(130, 15) for _ in range(200)]
+    whole, left, right = FeatureStats(1), FeatureStats(1), FeatureStats(1)
+    for i, x in enumerate(values):
+        whole.update(x, 0)
+        (left if i < 70 else right).update(x, 0)
+    left.merge(right)
+    assert left.n == whole.n and left.counts == whole.counts
+    assert left.mean == pytest.approx(whole.mean) and left.std == pytest.approx(whole.std)
+
+def test_flush_merges_into_drift_stats(drift_state):
+    for x in (110, 130, 150):
+        drift.observe(StubPredictor(), {'ap_hi': x, 'BMI': 22.0})
+    drift.flush()
+    drift.observe(StubPredictor(), {'ap_hi': 130, 'BMI': 31.0})
+    drift.flush()
+
+    rows = _stored()
+    assert rows['ap_hi']['n'] == 4 and rows['ap_hi']['mean'] == pytest.approx(130)
+    assert rows['ap_hi']['counts'] == '[1, 2, 1]'
+    assert rows['BMI']['counts'] == '[3, 1]'
+
+def test_failed_flush_keeps_the_observations(drift_state):
+    drift.observe(StubPredictor(), {'ap_hi': 150, 'BMI': 22.0})
+    conn = db.get_db_connection()
+    conn.execute("DROP TABLE drift_stats")
+    conn.commit()
+    conn.close()
+    drift.flush()  # fails: no table
+    drift.observe(StubPredictor(), {'ap_hi': 110, 'BMI': 22.0})
+
+    db.init_db()
+    drift.flush()
+    assert _stored()['ap_hi']['n'] == 2
+    assert drift._delta == {}
+
+@pytest.mark.skipif(not os.path.exists('cardio_model.pkl'), reason='trained models not available')
+def test_predict_observes_the_derived_bmi(drift_state, monkeypatch):
+    predictor = HeartDiseasePredictor()
+    monkeypatch.setattr(drift, '_baseline', {'source': 'test', 'n': 1, 'features': {
+        name: {'edges': [], 'probs': [1.0], 'mean': 0.0, 'std': 1.0} for name in FEATURES}})
+    predictor.predict({'age': 50 * 365, 'gender': 1, 'height': 160, 'weight': 64, 'ap_hi': 120, 'ap_lo': 80,
+                       'cholesterol': 1, 'gluc': 1, 'smoke': 0, 'alco': 0, 'active': 1})
+
+    assert set(drift._delta) == set(FEATURES)
+    assert drift._delta['BMI'].mean == pytest.approx(25.0)
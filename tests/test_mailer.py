@@ -0,0 +1,148 @@
+import time
+import threading
+import socketserver
+import pytest
+import utils.db as db
+import utils.mailer as mailer
+
+class DebuggingSmtp(socketserver.StreamRequestHandler):
+    """Minimal SMTP server that records every message; recipients in `reject` get a 550"""
+    messages = []
+    reject = set()
+
+    def handle(self):
+        self.wfile.write(b"220 test ESMTP\r\n")
+        rcpt, data, in_data = [], [], False
+        for line in self.rfile:
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    DebuggingSmtp.messages.append({'to': rcpt, 'data': b''.join(data).decode()})
+                    rcpt, data = [], []
+                    self.wfile.write(b"250 OK\r\n")
+                else:
+                    data.append(line)
+                continue
+            cmd = line[:4].upper()
+            if cmd == b"RCPT":
+                address = line.decode().split(':', 1)[1].strip().strip('<>')
+                if address in DebuggingSmtp.reject:
+                    self.wfile.write(b"550 No such user\r\n")
+                    continue
+                rcpt.append(address)
+                self.wfile.write(b"250 OK\r\n")
+            elif cmd == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+@pytest.fixture
+def smtp_server(temp_db, monkeypatch):
+    DebuggingSmtp.messages = []
+    DebuggingSmtp.reject = set()
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), DebuggingSmtp)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('EMAIL_SERVER', '127.0.0.1')
+    monkeypatch.setenv('EMAIL_PORT', str(server.server_address[1]))
+    monkeypatch.setenv('EMAIL_USE_TLS', '0')
+    monkeypatch.setenv('EMAIL_USER', 'heartguard@localhost')
+    monkeypatch.setenv('EMAIL_PASS', 'secret')
+    # Tests drive delivery themselves instead of the background threads
+    monkeypatch.setattr(mailer, 'start_mail_workers', lambda: None)
+    yield DebuggingSmtp
+    server.shutdown()
+    server.server_close()
+
+def _rows():
+    conn = db.get_db_connection()
+    rows = [dict(r) for r in conn.execute("SELECT * FROM email_queue ORDER BY id")]
+    conn.close()
+    return rows
+
+def test_delivers_and_redacts(smtp_server):
+    mailer.enqueue_email('a@example.com', 'Code', '<p>123456</p>', preview='OTP CODE: 123456')
+    mailer.enqueue_email('b@example.com', 'Risk', '<p>High Risk (81%)</p>', preview='Risk: High (81%)')
+    smtp = mailer.SmtpConnection()
+    mailer.process_queue('worker-1', smtp)
+    smtp.close()
+
+    assert [m['to'] for m in smtp_server.messages] == [['a@example.com'], ['b@example.com']]
+    assert '123456' in smtp_server.messages[0]['data']
+    for row in _rows():
+        assert row['status'] == 'sent' and row['sent_at']
+        assert row['html'] == '' and row['subject'] == '' and row['preview'] is None
+
+def test_rejected_message_is_retried_then_dead_lettered(smtp_server, monkeypatch):
+    monkeypatch.setattr(mailer, 'MAIL_MAX_ATTEMPTS', 2)
+    smtp_server.reject.add('nobody@example.com')
+    mailer.enqueue_email('nobody@example.com', 'Code', '<p>123456</p>', preview='OTP CODE: 123456')
+    smtp = mailer.SmtpConnection()
+
+    mailer.process_queue('worker-1', smtp)
+    row = _rows()[0]
+    assert row['status'] == 'pending' and row['attempts'] == 1 and row['html']
+    assert row['next_attempt'] > time.time()
+
+    conn = db.get_db_connection()
+    conn.execute("UPDATE email_queue SET next_attempt = 0")
+    conn.commit()
+    conn.close()
+    mailer.process_queue('worker-1', smtp)
+    smtp.close()
+    row = _rows()[0]
+    assert row['status'] == 'dead' and row['attempts'] == 2
+    assert row['html'] == '' and row['preview'] is None and row['last_error']
+    assert smtp_server.messages == []
+
+def test_expired_lease_is_not_sent_twice(smtp_server):
+    mailer.enqueue_email('a@example.com', 'Code', '<p>123456</p>')
+    stale = mailer._claim_batch('slow-worker')
+    # The slow worker's lease runs out and another worker takes the message over
+    conn = db.get_db_connection()
+    conn.execute("UPDATE email_queue SET locked_until = ?", (time.time() - 1,))
+    conn.commit()
+    conn.close()
+    smtp = mailer.SmtpConnection()
+    mailer.process_queue('fast-worker', smtp)
+
+    # The slow worker comes back: it must neither resend nor overwrite the new owner's outcome
+    assert not mailer._still_claimed(stale[0])
+    mailer._mark_failed(stale[0], 'timeout')
+    smtp.close()
+    assert len(smtp_server.messages) == 1
+    assert _rows()[0]['status'] == 'sent' and _rows()[0]['attempts'] == 0
+
+def test_lease_is_renewed_per_message(smtp_server):
+    assert mailer.MESSAGE_BUDGET < mailer.MAIL_LEASE <= 600
+    mailer.enqueue_email('a@example.com', 'Code', '<p>123456</p>')
+    mailer.enqueue_email('b@example.com', 'Code', '<p>654321</p>')
+    batch = mailer._claim_batch('worker-1')
+    conn = db.get_db_connection()
+    conn.execute("UPDATE email_queue SET locked_until = ?", (time.time() + 5,))
+    conn.commit()
+    conn.close()
+
+    # Only the message about to be sent gets a fresh lease; the rest of the batch keeps its own
+    assert mailer._still_claimed(batch[0])
+    first, second = _rows()
+    assert first['locked_until'] > time.time() + mailer.MAIL_LEASE - 5
+    assert second['locked_until'] < time.time() + 5
+
+def test_old_sent_records_are_purged(smtp_server):
+    mailer.enqueue_email('a@example.com', 'Code', '<p>123456</p>')
+    mailer.enqueue_email('b@example.com', 'Code', '<p>654321</p>')
+    smtp = mailer.SmtpConnection()
+    mailer.process_queue('worker-1', smtp)
+    smtp.close()
+    conn = db.get_db_connection()
+    conn.execute("UPDATE email_queue SET sent_at = datetime('now', '-30 days') WHERE to_email = 'a@example.com'")
+    conn.commit()
+    conn.close()
+
+    mailer.purge_sent(days=7)
+    assert [r['to_email'] for r in _rows()] == ['b@example.com']
@@ -0,0 +1,73 @@
+import os
+import json
+import stat
+import utils.metrics as metrics
+import utils.services  # noqa: F401  registers the AI gauges and counters
+
+def _worker_snapshot(directory, pid, circuit_open, cache_hits):
+    snap = {'pid': pid, 'histograms': [],
+            'counters': [['ai_cache_hits_total', [], cache_hits]],
+            'gauges': [['ai_circuit_open', [], circuit_open]]}
+    with open(os.path.join(directory, f"metrics_{pid}.json"), 'w') as f:
+        json.dump(snap, f)
+
+def test_workers_are_merged_by_kind(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    _worker_snapshot(tmp_path, 101, 1, 5)
+    _worker_snapshot(tmp_path, 102, 0, 7)
+    text = metrics.render_prometheus()
+
+    # Gauges stay per worker: one open breaker is 1, not the number of workers
+    assert 'ai_circuit_open{pid="101"} 1' in text
+    assert 'ai_circuit_open{pid="102"} 0' in text
+    assert '# TYPE ai_cache_hits_total counter' in text
+    own_hits = utils.services.response_cache.stats()['hits']
+    assert f'ai_cache_hits_total {12 + own_hits}' in text
+
+def _worker_counts(directory, pid, requests, latencies):
+    histogram = [0] * (len(metrics.BUCKETS) + 3)
+    for seconds in latencies:
+        histogram[0] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+    snap = {'pid': pid, 'gauges': [['ai_circuit_open', [], 0]],
+            'counters': [['http_requests_total', [['endpoint', 'chat']], requests]],
+            'histograms': [['http_request_duration_seconds', [['endpoint', 'chat']], histogram]]}
+    with open(os.path.join(directory, f"metrics_{pid}.json"), 'w') as f:
+        json.dump(snap, f)
+
+def test_exited_worker_keeps_its_counts_but_not_its_gauges(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, 'snapshot', lambda: {'pid': 999, 'counters': [], 'histograms': [], 'gauges': []})
+    _worker_counts(tmp_path, 101, 5, [0.0005])
+    _worker_counts(tmp_path, 102, 7, [0.0005, 0.0005])
+    metrics.retire_snapshot(101)
+    _worker_counts(tmp_path, 103, 1, [])
+    metrics.retire_snapshot(103)
+    metrics.retire_snapshot(103)  # already gone: no error
+    text = metrics.render_prometheus()
+
+    assert 'pid="101"' not in text and 'pid="103"' not in text
+    assert 'ai_circuit_open{pid="102"} 0' in text
+    # Totals don't go down when workers exit
+    assert 'http_requests_total{endpoint="chat"} 13' in text
+    assert 'http_request_duration_seconds_count{endpoint="chat"} 3' in text
+    files = os.listdir(tmp_path)
+    assert metrics.DEAD_SNAPSHOT in files and 'metrics_102.json' in files
+    assert 'metrics_101.json' not in files and 'metrics_103.json' not in files
+
+def test_shared_directory_must_be_private(tmp_path, monkeypatch):
+    shared = tmp_path / 'metrics'
+    shared.mkdir()
+    shared.chmod(0o777)
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(shared))
+    _worker_snapshot(shared, 101, 1, 5)
+
+    # Snapshots in a directory others can write to are not served
+    assert 'pid="101"' not in metrics.render_prometheus()
+    assert metrics._shared_dir() is None
+
+    private = tmp_path / 'private'
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(private))
+    assert metrics._shared_dir() == str(private)
+    assert stat.S_IMODE(os.stat(private).st_mode) == 0o700
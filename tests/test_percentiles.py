@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pandas as pd
+import utils.percentiles as percentiles
+
+class StubPredictor:
+    """Reference data whose predicted risk is simply systolic pressure / 200"""
+    def __init__(self, n=1000, seed=0):
+        rng = np.random.default_rng(seed)
+        self.X = pd.DataFrame({'age': rng.integers(30, 70, n) * 365, 'gender': rng.integers(1, 3, n),
+                               'ap_hi': rng.integers(90, 190, n)})
+
+    def load_reference_data(self):
+        return self.X, None
+
+    def predict_proba_batch(self, X):
+        return X['ap_hi'].to_numpy() / 200
+
+    def model_version(self):
+        return 'v1'
+
+def test_build_writes_atomically_and_loads_back(tmp_path):
+    path = str(tmp_path / 'risk_percentiles.npz')
+    built = percentiles.build_index(StubPredictor(), path=path)
+
+    assert os.listdir(tmp_path) == ['risk_percentiles.npz']
+    loaded = percentiles.load_index(path)
+    assert loaded.version == 'v1'
+    assert set(loaded.arrays) == set(built.arrays)
+    assert np.array_equal(loaded.arrays['all'], built.arrays['all'])
+
+def test_temp_file_is_unique_per_process(tmp_path, monkeypatch):
+    written = []
+    real_savez = np.savez_compressed
+    monkeypatch.setattr(np, 'savez_compressed', lambda file, **arrays: (written.append(file), real_savez(file, **arrays)))
+    for pid in (101, 102):
+        monkeypatch.setattr(os, 'getpid', lambda pid=pid: pid)
+        percentiles.build_index(StubPredictor(), path=str(tmp_path / 'risk_percentiles.npz'))
+    assert len(set(written)) == 2
+
+def test_lookup_uses_the_matching_stratum():
+    arrays = {'all': np.linspace(0, 1, 1000, dtype=np.float32),
+              'g1': np.linspace(0, 0.5, 500, dtype=np.float32),
+              'a50_g1': np.linspace(0, 0.25, 250, dtype=np.float32),
+              'a60_g1': np.linspace(0, 1, 50, dtype=np.float32)}
+    index = percentiles.PercentileIndex('v1', arrays)
+
+    found = index.lookup(0.125, age_years=55, gender=1)
+    assert found['group'] == 'women aged 50-59' and found['size'] == 250
+    assert found['percentile'] == 50.0
+    # The 60+ stratum is below MIN_STRATUM: fall back to all women
+    assert index.lookup(0.25, age_years=65, gender=1)['group'] == 'women'
+    assert index.lookup(0.5, age_years=65, gender=2)['group'] == 'people'
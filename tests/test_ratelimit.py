@@ -0,0 +1,72 @@
+import sqlite3
+import pytest
+import utils.ratelimit as ratelimit
+from utils.ratelimit import MemoryBuckets, SqliteBuckets
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+    monkeypatch.setattr(ratelimit.time, 'time', clock)
+    return clock
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path, clock):
+    return MemoryBuckets() if request.param == 'memory' else SqliteBuckets(str(tmp_path / 'ratelimit.db'))
+
+def test_bucket_denies_when_empty_and_refills(buckets, clock):
+    # 3 requests per 30 s: one token every 10 s
+    assert [buckets.take('user:chat:alice', 3, 0.1)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = buckets.take('user:chat:alice', 3, 0.1)
+    assert not allowed and retry_after == pytest.approx(10)
+
+    clock.now += 10
+    assert buckets.take('user:chat:alice', 3, 0.1) == (True, 0)
+    assert not buckets.take('user:chat:alice', 3, 0.1)[0]
+    # Other keys have their own bucket
+    assert buckets.take('user:chat:bob', 3, 0.1)[0]
+
+def test_locked_store_fails_open(tmp_path, capsys):
+    path = str(tmp_path / 'ratelimit.db')
+    buckets = SqliteBuckets(path, timeout=0.05)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        # Even an empty bucket is let through while another writer holds the lock
+        assert buckets.take('ip:login:1.2.3.4', 0.5, 0.01) == (True, 0)
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert '[RateLimit]' in capsys.readouterr().out
+    assert buckets.take('ip:login:1.2.3.4', 2, 0.01)[0]
+
+def test_sqlite_prune_drops_only_refilled_buckets(tmp_path, clock):
+    buckets = SqliteBuckets(str(tmp_path / 'ratelimit.db'))
+    buckets.take('fast', 10, 1.0)    # full again after 1 s
+    buckets.take('slow', 10, 0.001)  # full again after 1000 s
+    clock.now += 5
+    buckets.prune()
+    keys = [row[0] for row in buckets._conn().execute("SELECT key FROM buckets")]
+    assert keys == ['slow']
+
+def test_memory_prune_keeps_slow_buckets_of_other_scopes(clock):
+    buckets = MemoryBuckets(max_keys=1)
+    buckets.take('user:register:alice', 5, 5 / 3600)
+    clock.now += 5
+    # Pruning triggered by a fast-refilling key must not forget the slow bucket
+    buckets.take('ip:chat:1.2.3.4', 100, 100.0)
+    assert 'user:register:alice' in buckets._buckets
+
+def test_ip_limits_are_looser_than_user_limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'RATE_LIMIT_IP_FACTOR', 5)
+    user_limits = ratelimit.parse_limits('chat=20/60')
+    ip_limits = ratelimit.parse_limits('login=30/60', ratelimit.ip_defaults(user_limits))
+    assert ip_limits['chat'] == (100, 60)
+    assert ip_limits['login'] == (30, 60)
@@ -0,0 +1,52 @@
+import pytest
+import utils.services as services
+from utils.resilience import CircuitBreaker, Overloaded
+from utils.response_cache import ResponseCache
+
+class FullExecutor:
+    def submit(self, *args, **kwargs):
+        raise Overloaded()
+
+@pytest.fixture
+def half_open(monkeypatch):
+    """Breaker that has tripped and is ready to let a single trial call through"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(services, 'ai_breaker', breaker)
+    monkeypatch.setattr(services, 'AI_BACKEND', 'fake')
+    monkeypatch.setattr(services, 'response_cache', ResponseCache(max_entries=16))
+    return breaker
+
+def test_breaker_lets_one_trial_through_until_released():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def test_overloaded_trial_is_released(half_open, monkeypatch):
+    real_executor = services.ai_executor
+    monkeypatch.setattr(services, 'ai_executor', FullExecutor())
+    assert services.get_ai_response('What is LDL?') == services.ERROR_MESSAGE
+
+    monkeypatch.setattr(services, 'ai_executor', real_executor)
+    assert services.get_ai_response('What is LDL?') != services.ERROR_MESSAGE
+    assert half_open.state == 'closed'
+
+def test_overloaded_stream_trial_is_released(half_open, monkeypatch):
+    real_executor = services.ai_executor
+    monkeypatch.setattr(services, 'ai_executor', FullExecutor())
+    assert list(services.stream_ai_response('What is LDL?')) == [services.ERROR_MESSAGE]
+
+    monkeypatch.setattr(services, 'ai_executor', real_executor)
+    assert ''.join(services.stream_ai_response('What is LDL?')) != services.ERROR_MESSAGE
+    assert half_open.state == 'closed'
+
+def test_disconnected_stream_trial_is_released(half_open):
+    stream = services.stream_ai_response('What is LDL?')
+    assert next(stream)
+    stream.close()  # what the WSGI server does when the client goes away
+
+    assert half_open.allow()
@@ -0,0 +1,105 @@
+import pytest
+import utils.db as db
+import utils.services as services
+from utils.response_cache import ResponseCache, make_key, is_faq
+import app as app_module
+from app import app, build_chat_context
+
+@pytest.fixture
+def echo_ai(monkeypatch):
+    """AI backend whose reply is the context it was given, so leaks are visible in the answer"""
+    calls = []
+
+    def generate(prompt, context):
+        calls.append(prompt)
+        return f"Answer for [{context}]"
+
+    monkeypatch.setattr(services, 'AI_BACKEND', 'fake')
+    monkeypatch.setattr(services, '_generate', generate)
+    monkeypatch.setattr(services, 'response_cache', ResponseCache(max_entries=16))
+    return calls
+
+def _user(username, blood_type, ap_hi):
+    db.add_user(username, 'pw')
+    db.update_user_profile(username, {'dob': '1970-01-01', 'blood_type': blood_type})
+    db.log_prediction(username, {'ap_hi': ap_hi, 'ap_lo': 80, 'cholesterol': 1, 'gluc': 1},
+                      {'risk': 'High', 'prob': 81.0, 'suggestion': '...'})
+
+def _ask(username, prompt):
+    db.add_chat_message(username, 'user', prompt)
+    context, fields = build_chat_context(username)
+    reply = services.get_ai_response(prompt, context, fields)
+    db.add_chat_message(username, 'assistant', reply)
+    return reply
+
+def test_only_context_free_replies_share_a_key():
+    assert make_key('What is LDL?')[1] == 'generic'
+    assert make_key('What is LDL?', {'user': 'alice'})[1] == 'personal'
+    assert make_key('What is LDL?', {'user': 'alice'})[0] != make_key('What is LDL?', {'user': 'bob'})[0]
+
+def test_generic_prompt_from_two_users_is_not_shared(temp_db, echo_ai):
+    _user('alice', 'A+', 150)
+    _user('bob', 'O-', 110)
+
+    alice = _ask('alice', 'What foods lower blood pressure?')
+    bob = _ask('bob', 'What foods lower blood pressure?')
+
+    assert len(echo_ai) == 2
+    assert 'alice' in alice and 'BP=150/80' in alice
+    assert 'alice' not in bob and 'BP=150/80' not in bob and 'A+' not in bob
+    assert 'bob' in bob and 'BP=110/80' in bob
+
+def test_follow_up_is_keyed_on_the_conversation(temp_db, echo_ai):
+    _user('alice', 'A+', 150)
+    _ask('alice', 'What is LDL?')
+    first = _ask('alice', 'Tell me more')
+    _ask('alice', 'How much should I walk?')
+    second = _ask('alice', 'Tell me more')
+
+    assert len(echo_ai) == 4
+    assert first != second
+
+def test_repeat_with_identical_context_is_cached(echo_ai):
+    fields = {'user': 'alice', 'conversation': []}
+    first = services.get_ai_response('What is LDL?', 'User: alice', fields)
+    second = services.get_ai_response('What is LDL?', 'User: alice', fields)
+
+    assert first == second
+    assert len(echo_ai) == 1
+
+def _client(username):
+    client = app.test_client()
+    client.post('/register', data={'username': username, 'password': 'pw', 'confirm_password': 'pw'})
+    return client
+
+def _replies(username):
+    return [m['content'] for m in db.get_chat_messages(username) if m['role'] == 'assistant']
+
+@pytest.fixture
+def chat_clients(temp_db, echo_ai, monkeypatch):
+    monkeypatch.setattr(app_module, '_setup_done', True)
+    return _client('alice'), _client('bob')
+
+def test_faq_detection():
+    assert is_faq('What is a healthy blood pressure?')
+    assert is_faq('Which foods lower LDL cholesterol')
+    assert not is_faq('What does my blood pressure mean?')
+    assert not is_faq('Can you explain that again?')
+    assert not is_faq('Why?')
+
+def test_faq_reply_is_shared_across_users_through_chat(chat_clients, echo_ai):
+    alice, bob = chat_clients
+    alice.post('/chat', data={'prompt': 'What is a healthy blood pressure?'})
+    bob.post('/chat', data={'prompt': 'what is a healthy blood pressure'})
+
+    assert len(echo_ai) == 1
+    assert services.response_cache.hits == 1
+    assert _replies('alice') == _replies('bob') == ['Answer for []']
+
+def test_personal_prompt_through_chat_is_not_shared(chat_clients, echo_ai):
+    alice, bob = chat_clients
+    alice.post('/chat', data={'prompt': 'Is my blood pressure healthy?'})
+    bob.post('/chat', data={'prompt': 'Is my blood pressure healthy?'})
+
+    assert len(echo_ai) == 2
+    assert 'alice' in _replies('alice')[0] and 'alice' not in _replies('bob')[0]
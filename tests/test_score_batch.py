@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import pytest
+import pandas as pd
+import score_batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not os.path.exists(os.path.join(ROOT, 'cardio_model.pkl')),
+                                reason='trained models not available')
+
+@pytest.fixture
+def screening(tmp_path):
+    path = tmp_path / 'screening.csv'
+    pd.read_csv(os.path.join(ROOT, 'final_cardio_train_data.csv'), nrows=230).to_csv(path, index=False)
+    return str(path)
+
+def _run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['score_batch.py', *args, '--workers', '1', '--chunksize', '50',
+                                      '--model-dir', ROOT])
+    score_batch.main()
+
+def _interrupt_after(output, chunks, chunksize=50):
+    """Turn a finished run into one that stopped after `chunks` chunks, mid-way through the next"""
+    with open(output, 'rb') as f:
+        lines = f.readlines()
+    done = b''.join(lines[:1 + chunks * chunksize])
+    with open(output, 'wb') as f:
+        f.write(done + b''.join(lines[1 + chunks * chunksize:][:7]))  # part of a chunk never checkpointed
+    checkpoint = score_batch._checkpoint_path(output)
+    with open(checkpoint) as f:
+        state = json.load(f)
+    state.update(chunks=chunks, rows=chunks * chunksize, bytes=len(done))
+    state.pop('finished')
+    with open(checkpoint, 'w') as f:
+        json.dump(state, f)
+
+def test_resume_after_interruption_matches_a_full_run(screening, tmp_path, monkeypatch):
+    output = str(tmp_path / 'scored.csv')
+    _run(monkeypatch, screening, output)
+    with open(output) as f:
+        expected = f.read()
+    assert len(pd.read_csv(output)) == 230
+
+    _interrupt_after(output, chunks=2)
+    _run(monkeypatch, screening, output)
+
+    with open(output) as f:
+        assert f.read() == expected
+
+@pytest.mark.parametrize('damage', ['deleted', 'truncated'])
+def test_resume_refuses_a_damaged_output(screening, tmp_path, monkeypatch, damage):
+    output = str(tmp_path / 'scored.csv')
+    _run(monkeypatch, screening, output)
+    _interrupt_after(output, chunks=2)
+    if damage == 'deleted':
+        os.remove(output)
+    else:
+        with open(output, 'r+b') as f:
+            f.truncate(100)
+
+    with pytest.raises(SystemExit) as exc:
+        _run(monkeypatch, screening, output)
+    assert '--restart' in str(exc.value)
+
+    _run(monkeypatch, screening, output, '--restart')
+    assert len(pd.read_csv(output)) == 230
@@ -0,0 +1,54 @@
+import json
+import math
+import datetime
+import utils.db as db
+from utils.timeseries import lttb
+import app as app_module
+
+def _wave(n):
+    return [(i, 50 + 10 * math.sin(i / 25)) for i in range(n)]
+
+def test_lttb_keeps_the_point_budget_and_both_ends():
+    points = _wave(5000)
+    sampled = lttb(points, 200)
+
+    assert len(sampled) == 200
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    # A subset of the input, still in x order
+    assert [p[0] for p in sampled] == sorted(p[0] for p in sampled)
+    assert set(sampled) <= set(points)
+
+def test_lttb_keeps_a_single_spike():
+    points = _wave(5000)
+    points[3210] = (3210, 99.0)
+    assert (3210, 99.0) in lttb(points, 100)
+
+def test_lttb_returns_short_series_unchanged():
+    points = _wave(50)
+    assert lttb(points, 200) == points
+    assert lttb(points, 2) == points
+
+def _seed(username, days, per_day):
+    start = datetime.datetime(2025, 1, 1)
+    rows = [(username, '{}', json.dumps({'risk': 'Low', 'prob': 40.0 + d % 7}),
+             (start + datetime.timedelta(days=d, hours=h)).strftime('%Y-%m-%d %H:%M:%S'))
+            for d in range(days) for h in range(per_day)]
+    conn = db.get_db_connection()
+    conn.executemany("INSERT INTO predictions (username, input_data, result, timestamp) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def test_risk_trend_fits_the_chart_budget(temp_db):
+    _seed('alice', days=400, per_day=3)
+    labels, values, avg, total = app_module.build_risk_trend('alice', 'auto')
+
+    assert total == 1200
+    # Too many assessments: daily averages, then LTTB down to the budget
+    assert len(values) == len(labels) == app_module.CHART_MAX_POINTS
+    assert labels[0] == 'Jan 01, 2025' and labels[-1] == 'Feb 04, 2026'
+    assert avg == round(sum(40.0 + d % 7 for d in range(400)) / 400, 1)
+
+def test_short_history_is_shown_point_by_point(temp_db):
+    _seed('alice', days=5, per_day=2)
+    labels, values, avg, total = app_module.build_risk_trend('alice', 'auto')
+    assert total == len(values) == 10
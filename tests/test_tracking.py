@@ -0,0 +1,42 @@
+import datetime
+import pytest
+import utils.db as db
+import utils.tracking as tracking
+
+TODAY = datetime.date(2026, 3, 18)  # a Wednesday
+
+def _log(*days_ago, minutes=30, activity='Walking'):
+    for d in days_ago:
+        tracking.log_activity('alice', activity, minutes, TODAY - datetime.timedelta(days=d))
+
+@pytest.fixture
+def alice(temp_db):
+    db.add_user('alice', 'pw')
+    return 'alice'
+
+def test_streak_breaks_at_a_gap(alice):
+    # Runs: 9-6 days ago (4 days), gap on day 5, then 4-0 days ago (5 days, two sessions today)
+    _log(9, 8, 7, 6, 4, 3, 2, 1, 0, 0)
+    assert tracking.get_streaks(alice, today=TODAY) == {'current': 5, 'longest': 5}
+
+    _log(15, 14, 13, 12, 11, 10)  # now 9-6 joins into 15-6: 10 days
+    assert tracking.get_streaks(alice, today=TODAY) == {'current': 5, 'longest': 10}
+
+def test_streak_survives_until_the_day_is_over(alice):
+    _log(3, 2, 1)
+    assert tracking.get_streaks(alice, today=TODAY)['current'] == 3
+    assert tracking.get_streaks(alice, today=TODAY + datetime.timedelta(days=1))['current'] == 0
+
+def test_summary_totals(alice):
+    _log(0, 2, minutes=20)             # this week (Mon 16th onwards)
+    _log(5, minutes=45, activity='Swim')  # last week, same month
+    summary = tracking.get_summary(alice, today=TODAY)
+
+    assert summary['week_minutes'] == 40
+    assert summary['month_minutes'] == 85
+    assert summary['breakdown'][0] == {'activity': 'Swim', 'minutes': 45, 'sessions': 1}
+    assert [r['date'] for r in summary['recent']] == ['2026-03-18', '2026-03-16', '2026-03-13']
+
+def test_rejects_non_positive_duration(alice):
+    with pytest.raises(ValueError):
+        tracking.log_activity(alice, 'Walking', 0)
@@ -0,0 +1,46 @@
+import numpy as np
+from utils.whatif import what_if
+
+class LinearPredictor:
+    """Risk in [0, 1] from a few inputs; keeps every batch it was asked to score"""
+    models = {'stub': None}
+
+    def __init__(self):
+        self.batches = []
+
+    def to_frame(self, records):
+        self.batches.append(records)
+        return records
+
+    def predict_proba_batch(self, records):
+        return np.array([0.2 + r['ap_hi'] / 1000 + 0.004 * r['smoke'] + 0.1 * (r['cholesterol'] - 1)
+                         for r in records])
+
+DATA = {'age': 55 * 365, 'gender': 2, 'height': 170, 'weight': 70, 'ap_hi': 150, 'ap_lo': 70,
+        'cholesterol': 3, 'gluc': 1, 'smoke': 1, 'alco': 0, 'active': 1}
+
+def test_combined_row_only_applies_listed_changes():
+    predictor = LinearPredictor()
+    results = what_if(predictor, DATA, limit=2)
+
+    labels = [r['label'] for r in results]
+    assert labels == ['Bring cholesterol to normal', 'Lower systolic pressure by 20 mmHg',
+                      'All of these changes together']
+    combined = predictor.batches[-1][0]
+    assert combined['cholesterol'] == 1 and combined['ap_hi'] == 130
+    # Quitting smoking is below MIN_EFFECT
+    assert combined['smoke'] == 1
+    assert results[-1]['delta'] == round(results[0]['delta'] + results[1]['delta'], 1)
+
+def test_single_listed_change_has_no_combined_row():
+    results = what_if(LinearPredictor(), DATA, limit=1)
+    assert [r['label'] for r in results] == ['Bring cholesterol to normal']
+
+def test_each_factor_is_listed_once_at_its_best_level():
+    predictor = LinearPredictor()
+    results = what_if(predictor, DATA, limit=5)
+
+    assert [r['label'] for r in results] == ['Bring cholesterol to normal', 'Lower systolic pressure by 20 mmHg',
+                                             'All of these changes together']
+    # Both systolic levels were scored, in the same batch as everything else
+    assert sorted(r['ap_hi'] for r in predictor.batches[0]) == [130, 140, 150, 150, 150, 150]
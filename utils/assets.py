@@ -0,0 +1,151 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import stat
+import threading
+from functools import lru_cache
+from flask import request, abort, send_from_directory, Response
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+# Static files are linked as name.<content hash>.ext and cached for a year; a changed
+# file gets a new URL. Text responses are gzip/Brotli compressed for clients that accept it.
+STATIC_MAX_AGE = 365 * 24 * 3600
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+# Unset: Jinja's own per-user 0700 directory under the system temp dir (ownership is checked)
+JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR')
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+_manifest = None  # relative path -> fingerprinted path
+_originals = {}   # fingerprinted path -> relative path
+_manifest_lock = threading.Lock()
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+def build_manifest(static_folder):
+    manifest, originals = {}, {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{stem}.{_fingerprint(full)}{ext}"
+            manifest[rel] = hashed
+            originals[hashed] = rel
+    return manifest, originals
+
+def _get_manifest(app):
+    global _manifest, _originals
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest, _originals = build_manifest(app.static_folder)
+    return _manifest
+
+def asset_url(app, filename):
+    """URL of a static file with its content hash; unknown files fall back to the plain path"""
+    hashed = _get_manifest(app).get(filename.lstrip('/'), filename.lstrip('/'))
+    return f"{app.static_url_path}/{hashed}"
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def _is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE)
+
+@lru_cache(maxsize=256)
+def _precompressed(path, mtime, encoding):
+    """Compressed bytes of a static file, computed once per (file version, encoding)"""
+    with open(path, 'rb') as f:
+        return _compress(f.read(), encoding)
+
+def warm_templates(app):
+    """Compile every template now (e.g. in the gunicorn master, before forking)"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+def private_dir(path):
+    """Create `path` as 0700, or accept it only if it is ours and nobody else can write to it"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        return False
+    return True
+
+def _bytecode_cache():
+    # Cached bytecode is executed, so the directory must not be writable by anyone else
+    if not JINJA_CACHE_DIR:
+        return FileSystemBytecodeCache()
+    if not private_dir(JINJA_CACHE_DIR):
+        print(f"[Assets] {JINJA_CACHE_DIR} is not a private directory owned by this user; template bytecode cache disabled")
+        return None
+    return FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+def init_app(app):
+    app.jinja_env.bytecode_cache = _bytecode_cache()
+    app.jinja_env.globals['asset_url'] = lambda filename: asset_url(app, filename)
+
+    def serve_static(filename):
+        _get_manifest(app)
+        original = _originals.get(filename)
+        path = safe_join(app.static_folder, original or filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(path)[0]
+        encoding = _accepted_encoding() if _is_compressible(mimetype) else None
+        if encoding:
+            body = _precompressed(path, os.path.getmtime(path), encoding)
+            response = Response(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+        else:
+            response = send_from_directory(app.static_folder, original or filename)
+        if original:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = serve_static
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+                or not _is_compressible(response.mimetype)):
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _accepted_encoding()
+        if encoding:
+            response.set_data(_compress(data, encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
@@ -1,12 +1,56 @@
 import sqlite3
 import os
+import re
 import json
+import time
 import datetime
+from functools import lru_cache
+import utils.metrics as metrics
 
-DB_NAME = 'heartguard.db'
+DB_NAME = os.getenv('DATABASE_PATH', 'heartguard.db')
+
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)', re.IGNORECASE)
+
+@lru_cache(maxsize=256)
+def _query_labels(sql):
+    """Metric labels for a statement, e.g. {'op': 'SELECT', 'table': 'predictions'} (cached per SQL string)"""
+    words = sql.split(None, 1)
+    match = _TABLE_RE.search(sql)
+    return {'op': words[0].upper() if words else '?', 'table': match.group(1) if match else '-'}
+
+def _record_query(sql, start):
+    labels = _query_labels(sql)
+    metrics.observe('db_query_duration_seconds', time.perf_counter() - start, labels)
+    metrics.inc('db_queries_total', labels)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _record_query(sql, start)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            _record_query(sql, start)
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that records count and latency of every statement"""
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -46,6 +90,8 @@ def init_db():
         )
     ''')
     
+    c.execute('CREATE INDEX IF NOT EXISTS idx_predictions_user_time ON predictions (username, timestamp)')
+    
     # Activity Logs Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS activity_logs (
@@ -58,15 +104,80 @@ def init_db():
             FOREIGN KEY (username) REFERENCES users (username)
         )
     ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activity_logs_user_date ON activity_logs (username, date)')
+    
+    # Server-side Sessions (cookie only carries the session id)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,       -- JSON string
+            expiry REAL NOT NULL      -- Unix timestamp
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry)')
+    
+    # Chat History (bounded per user, see CHAT_HISTORY_MAX)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (username, id)')
+    
+    # Outbound Email Queue (delivered by utils.mailer workers)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS email_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            preview TEXT,
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, sending, sent, dead
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            locked_until REAL,
+            claim TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_email_queue_status ON email_queue (status, next_attempt)')
+    
+    # Streaming input statistics for drift monitoring (merged from every worker)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS drift_stats (
+            feature TEXT PRIMARY KEY,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            counts TEXT NOT NULL,     -- JSON list, one count per baseline bin
+            source TEXT NOT NULL,     -- baseline the bins belong to
+            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     
     conn.commit()
     conn.close()
     print("Database initialized.")
 
+def ensure_schema():
+    """Create/upgrade tables; legacy JSON/CSV files are only imported into a brand-new database"""
+    fresh = not os.path.exists(DB_NAME)
+    init_db()
+    add_missing_columns()
+    if fresh:
+        migrate_from_files()
+
 def migrate_from_files():
     """Attempt to migrate existing JSON/CSV data to SQLite"""
-    if not os.path.exists(DB_NAME):
-        init_db()
+    # Tables are created with IF NOT EXISTS, so this also upgrades older databases
+    init_db()
         
     conn = get_db_connection()
     c = conn.cursor()
@@ -105,16 +216,17 @@ def migrate_from_files():
             print("Predictions migrated.")
         except Exception as e: print(f"Prediction migration failed: {e}")
 
-    # Migrate Activity Logs
+    # Migrate Activity Logs (legacy CSV written by the old tracking module)
     if os.path.exists('activity_log.csv'):
         try:
-            import pandas as pd
-            df = pd.read_csv('activity_log.csv')
-            for _, row in df.iterrows():
-                try:
-                    c.execute("INSERT INTO activity_logs (username, activity, duration, date) VALUES (?, ?, ?, ?)",
-                              (row['user'], row['activity'], row['duration'], row['date']))
-                except: pass
+            import csv
+            with open('activity_log.csv', newline='') as f:
+                for row in csv.DictReader(f):
+                    try:
+                        c.execute("INSERT INTO activity_logs (username, activity, duration, date) VALUES (?, ?, ?, ?)",
+                                  (row.get('user_id') or row['user'], row['activity'],
+                                   int(float(row.get('duration_mins') or row['duration'])), row['date'][:10]))
+                    except: pass
             print("Activity logs migrated.")
         except Exception as e: print(f"Activity migration failed: {e}")
         
@@ -173,18 +285,55 @@ def get_all_activity_logs():
     conn.close()
     return logs
 
-def get_user_history(username):
+def get_user_history(username, limit=None):
     conn = get_db_connection()
-    # Removed LIMIT 5 to show all history in profile
-    preds = conn.execute("SELECT * FROM predictions WHERE username = ? ORDER BY timestamp DESC", (username,)).fetchall()
+    query = "SELECT * FROM predictions WHERE username = ? ORDER BY timestamp DESC"
+    if limit:
+        preds = conn.execute(query + " LIMIT ?", (username, limit)).fetchall()
+    else:
+        preds = conn.execute(query, (username,)).fetchall()
     conn.close()
     return preds
+
+def get_highest_risk_prediction(username):
+    conn = get_db_connection()
+    row = conn.execute(f"""
+        SELECT id, username, input_data, result, timestamp
+        FROM (SELECT *, CAST(json_extract({_RESULT_JSON}, '$.prob') AS REAL) AS p
+              FROM predictions WHERE username = ?)
+        ORDER BY {_PROB_PCT} DESC LIMIT 1
+    """, (username,)).fetchone()
+    conn.close()
+    return row
     
-def get_user_activity(username):
+# Older rows stored the result JSON-encoded twice; unwrap it before extracting fields
+_RESULT_JSON = "CASE WHEN NOT json_valid(result) THEN NULL WHEN json_type(result) = 'text' THEN json_extract(result, '$') ELSE result END"
+# Probability as a percentage; very old rows stored 0-1
+_PROB_PCT = "CASE WHEN p <= 1.0 THEN p * 100 ELSE p END"
+RISK_SERIES_BUCKETS = {
+    'raw': 'id',
+    'daily': 'date(timestamp)',
+    'weekly': "date(timestamp, '-6 days', 'weekday 1')",  # Monday of the week
+}
+
+def get_risk_series(username, bucket='raw'):
+    """
+    Risk probability over time, oldest first, aggregated per bucket ('raw', 'daily', 'weekly').
+    Rows: epoch (start of bucket), prob (mean %), peak (max %), n. Only timestamp and prob are read.
+    """
+    group = RISK_SERIES_BUCKETS[bucket]
     conn = get_db_connection()
-    logs = conn.execute("SELECT * FROM activity_logs WHERE username = ? ORDER BY timestamp DESC", (username,)).fetchall()
+    rows = conn.execute(f"""
+        SELECT CAST(strftime('%s', MIN(timestamp)) AS INTEGER) AS epoch,
+               AVG({_PROB_PCT}) AS prob, MAX({_PROB_PCT}) AS peak, COUNT(*) AS n
+        FROM (SELECT id, timestamp, CAST(json_extract({_RESULT_JSON}, '$.prob') AS REAL) AS p
+              FROM predictions WHERE username = ?)
+        WHERE p IS NOT NULL
+        GROUP BY {group}
+        ORDER BY epoch
+    """, (username,)).fetchall()
     conn.close()
-    return logs
+    return rows
 
 def get_all_user_predictions(username):
     conn = get_db_connection()
@@ -192,6 +341,35 @@ def get_all_user_predictions(username):
     conn.close()
     return preds
 
+# --- Chat History Helpers ---
+CHAT_HISTORY_MAX = int(os.getenv('CHAT_HISTORY_MAX', 200))
+
+def add_chat_message(username, role, content):
+    """Append a chat turn and page out anything beyond CHAT_HISTORY_MAX for this user"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO chat_messages (username, role, content) VALUES (?, ?, ?)", (username, role, content))
+    c.execute('''
+        DELETE FROM chat_messages
+        WHERE username = ? AND id <= (
+            SELECT id FROM chat_messages WHERE username = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+    ''', (username, username, CHAT_HISTORY_MAX))
+    conn.commit()
+    conn.close()
+
+def get_chat_messages(username, limit=20, before=None):
+    """Return up to `limit` messages (oldest first), optionally only those older than id `before`"""
+    conn = get_db_connection()
+    if before:
+        rows = conn.execute("SELECT * FROM chat_messages WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                            (username, before, limit)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM chat_messages WHERE username = ? ORDER BY id DESC LIMIT ?",
+                            (username, limit)).fetchall()
+    conn.close()
+    return list(reversed(rows))
+
 # --- User Profile Helpers ---
 def update_user_profile(username, data):
     conn = get_db_connection()
@@ -199,10 +377,12 @@ def update_user_profile(username, data):
     try:
         c.execute('''
             UPDATE users 
-            SET full_name = ?, phone = ?, dob = ?, address = ?, blood_type = ?, allergies = ?, chronic_diseases = ?
+            SET full_name = ?, phone = ?, dob = ?, address = ?, blood_type = ?, allergies = ?, chronic_diseases = ?,
+                email = ?
             WHERE username = ?
         ''', (data.get('full_name'), data.get('phone'), data.get('dob'), data.get('address'), 
-              data.get('blood_type'), data.get('allergies'), data.get('chronic_diseases'), username))
+              data.get('blood_type'), data.get('allergies'), data.get('chronic_diseases'),
+              (data.get('email') or '').strip() or None, username))
         conn.commit()
     except Exception as e:
         print(f"Error updating profile: {e}")
@@ -0,0 +1,252 @@
+"""
+Input drift monitoring for live predictions.
+
+Each process keeps O(1) state per feature: count, Welford mean/M2 and counts over fixed
+bins taken from the training data. A background thread periodically merges that delta
+into the drift_stats table (Chan et al. parallel merge), so every gunicorn worker
+contributes to one picture. The admin page compares it with the training baseline
+using PSI and a binned KS distance.
+"""
+import os
+import json
+import math
+import time
+import atexit
+import bisect
+import threading
+import utils.db as db
+
+DRIFT_BASELINE_PATH = os.getenv('DRIFT_BASELINE_PATH', 'drift_baseline.json')
+DRIFT_FLUSH_INTERVAL = float(os.getenv('DRIFT_FLUSH_INTERVAL', 30))
+DRIFT_MIN_SAMPLES = int(os.getenv('DRIFT_MIN_SAMPLES', 50))
+# Usual PSI reading: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 significant shift
+PSI_WARN = float(os.getenv('DRIFT_PSI_WARN', 0.1))
+PSI_ALERT = float(os.getenv('DRIFT_PSI_ALERT', 0.25))
+KS_ALERT = float(os.getenv('DRIFT_KS_ALERT', 0.2))
+
+CATEGORICAL = ('gender', 'cholesterol', 'gluc', 'smoke', 'alco', 'active')
+N_BINS = 10
+
+_baseline = None
+_baseline_lock = threading.Lock()
+_delta = {}  # feature -> FeatureStats observed since the last flush
+_delta_lock = threading.Lock()
+_flusher = None
+
+class FeatureStats:
+    __slots__ = ('n', 'mean', 'm2', 'counts')
+
+    def __init__(self, n_bins, n=0, mean=0.0, m2=0.0, counts=None):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.counts = counts or [0] * n_bins
+
+    def update(self, x, bin_index):
+        # Welford's online mean/variance
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        self.counts[bin_index] += 1
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean += d * other.n / n
+        self.m2 += other.m2 + d * d * self.n * other.n / n
+        self.n = n
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+# --- Training Baseline ---
+def _source_tag(predictor):
+    st = os.stat(predictor.data_path)
+    return f"{os.path.basename(predictor.data_path)}:{st.st_size}:{int(st.st_mtime)}"
+
+def build_baseline(predictor, path=DRIFT_BASELINE_PATH):
+    """Per-feature bins, bin shares, mean and std of the training data (in model units)"""
+    import numpy as np
+    X, _ = predictor.load_reference_data()
+    features = {}
+    for name in X.columns:
+        values = X[name].to_numpy(dtype=float)
+        if name in CATEGORICAL:
+            levels = np.unique(values)
+            edges = ((levels[1:] + levels[:-1]) / 2).tolist()
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, N_BINS + 1)[1:-1])).tolist()
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        features[name] = {
+            'edges': edges,
+            'probs': (counts / len(values)).tolist(),
+            'mean': float(values.mean()),
+            'std': float(values.std(ddof=1)),
+        }
+    baseline = {'source': _source_tag(predictor), 'n': int(len(X)), 'features': features}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(baseline, f)
+    os.replace(tmp, path)
+    print(f"[Drift] Built training baseline for {len(features)} features from {len(X):,} rows")
+    return baseline
+
+def get_baseline(predictor):
+    """Baseline from disk, rebuilt when the reference CSV changes"""
+    global _baseline
+    if _baseline is not None:
+        return _baseline
+    with _baseline_lock:
+        if _baseline is None:
+            baseline = None
+            if os.path.exists(DRIFT_BASELINE_PATH):
+                try:
+                    with open(DRIFT_BASELINE_PATH) as f:
+                        baseline = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[Drift] Baseline Load Error: {e}")
+            if baseline is None or baseline.get('source') != _source_tag(predictor):
+                baseline = build_baseline(predictor)
+            _baseline = baseline
+    return _baseline
+
+# --- Streaming Updates ---
+def observe(predictor, record):
+    """Fold one live prediction input (dict in model units) into this process's stats"""
+    if not os.path.exists(predictor.data_path):
+        return
+    try:
+        features = get_baseline(predictor)['features']
+        with _delta_lock:
+            for name, base in features.items():
+                x = record.get(name)
+                if x is None:
+                    continue
+                x = float(x)
+                stats = _delta.get(name)
+                if stats is None:
+                    stats = _delta[name] = FeatureStats(len(base['probs']))
+                stats.update(x, bisect.bisect_right(base['edges'], x))
+    except Exception as e:
+        print(f"[Drift] Observe Error: {e}")
+
+def flush():
+    """Merge this process's delta into drift_stats"""
+    global _delta
+    with _delta_lock:
+        pending, _delta = _delta, {}
+    if not pending or _baseline is None:
+        return
+    source = _baseline['source']
+    conn = db.get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for name, delta in pending.items():
+            row = conn.execute("SELECT n, mean, m2, counts, source FROM drift_stats WHERE feature = ?", (name,)).fetchone()
+            total = FeatureStats(len(delta.counts))
+            if row and row['source'] == source:
+                total = FeatureStats(len(delta.counts), row['n'], row['mean'], row['m2'], json.loads(row['counts']))
+            total.merge(delta)
+            conn.execute("INSERT OR REPLACE INTO drift_stats (feature, n, mean, m2, counts, source, updated) "
+                         "VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                         (name, total.n, total.mean, total.m2, json.dumps(total.counts), source))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[Drift] Flush Error: {e}")
+        _restore(pending)
+    finally:
+        conn.close()
+
+def _restore(pending):
+    """Put an unwritten delta back so the next flush retries it"""
+    with _delta_lock:
+        for name, stats in pending.items():
+            newer = _delta.get(name)
+            if newer is not None:
+                stats.merge(newer)
+            _delta[name] = stats
+
+def reset():
+    global _delta
+    with _delta_lock:
+        _delta = {}
+    conn = db.get_db_connection()
+    conn.execute("DELETE FROM drift_stats")
+    conn.commit()
+    conn.close()
+
+def start_drift_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+
+    def _loop():
+        while True:
+            time.sleep(DRIFT_FLUSH_INTERVAL)
+            flush()
+
+    _flusher = threading.Thread(target=_loop, name='drift-flush', daemon=True)
+    _flusher.start()
+    atexit.register(flush)
+
+# --- Scores ---
+def psi(expected, actual, eps=1e-4):
+    """Population Stability Index between two bin-share vectors"""
+    total = 0.0
+    for e, a in zip(expected, actual):
+        e, a = max(e, eps), max(a, eps)
+        total += (a - e) * math.log(a / e)
+    return total
+
+def ks_binned(expected, actual):
+    """Largest gap between the two cumulative distributions, evaluated at the bin edges"""
+    gap = cum_e = cum_a = 0.0
+    for e, a in zip(expected, actual):
+        cum_e += e
+        cum_a += a
+        gap = max(gap, abs(cum_a - cum_e))
+    return gap
+
+def report(predictor):
+    """Per-feature drift scores and a status ('ok', 'warn', 'alert', 'insufficient')"""
+    if not os.path.exists(predictor.data_path):
+        return []
+    baseline = get_baseline(predictor)
+    flush()
+    conn = db.get_db_connection()
+    rows = {r['feature']: r for r in conn.execute("SELECT * FROM drift_stats WHERE source = ?", (baseline['source'],))}
+    conn.close()
+
+    results = []
+    for name, base in baseline['features'].items():
+        row = rows.get(name)
+        stats = FeatureStats(len(base['probs']), row['n'], row['mean'], row['m2'], json.loads(row['counts'])) if row \
+            else FeatureStats(len(base['probs']))
+        entry = {'feature': name, 'n': stats.n, 'train_mean': round(base['mean'], 2), 'live_mean': None,
+                 'live_std': None, 'shift_sd': None, 'psi': None, 'ks': None, 'status': 'insufficient'}
+        if stats.n:
+            actual = [c / stats.n for c in stats.counts]
+            entry.update({
+                'live_mean': round(stats.mean, 2),
+                'live_std': round(stats.std, 2),
+                'shift_sd': round((stats.mean - base['mean']) / base['std'], 2) if base['std'] else 0.0,
+                'psi': round(psi(base['probs'], actual), 3),
+                'ks': round(ks_binned(base['probs'], actual), 3),
+            })
+            if stats.n >= DRIFT_MIN_SAMPLES:
+                if entry['psi'] > PSI_ALERT or entry['ks'] > KS_ALERT:
+                    entry['status'] = 'alert'
+                elif entry['psi'] > PSI_WARN:
+                    entry['status'] = 'warn'
+                else:
+                    entry['status'] = 'ok'
+        results.append(entry)
+    order = {'alert': 0, 'warn': 1, 'ok': 2, 'insufficient': 3}
+    results.sort(key=lambda e: (order[e['status']], -(e['psi'] or 0)))
+    return results
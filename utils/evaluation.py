@@ -0,0 +1,86 @@
+import numpy as np
+
+# Curve metrics for a binary classifier from a single sort of its scores.
+# Every threshold's confusion matrix is read off cumulative counts, so nothing is re-scored.
+
+THRESHOLDS = np.round(np.linspace(0.05, 0.95, 19), 2)
+CALIBRATION_BINS = 10
+MAX_CURVE_POINTS = 200
+
+def _thin(*arrays, limit=MAX_CURVE_POINTS):
+    """Keep at most `limit` evenly spaced points (always including both ends) for plotting"""
+    n = len(arrays[0])
+    if n <= limit:
+        return [a.tolist() for a in arrays]
+    idx = np.unique(np.linspace(0, n - 1, limit).round().astype(int))
+    return [a[idx].tolist() for a in arrays]
+
+def curve_metrics(y_true, scores, thresholds=THRESHOLDS, n_bins=CALIBRATION_BINS):
+    """
+    ROC and precision-recall curves, a confusion matrix per threshold, and reliability bins.
+    `scores` should be probabilities in [0, 1]; y_true is 0/1.
+    """
+    y = np.asarray(y_true, dtype=np.int64)
+    s = np.clip(np.asarray(scores, dtype=np.float64), 0.0, 1.0)
+    order = np.argsort(-s, kind='mergesort')
+    s_sorted, y_sorted = s[order], y[order]
+    pos = int(y.sum())
+    neg = len(y) - pos
+
+    # Cumulative counts when everything scoring >= s_sorted[i] is called positive;
+    # ties are collapsed to their last index so each distinct score is one operating point
+    cum_tp = np.cumsum(y_sorted)
+    cum_fp = np.arange(1, len(y) + 1) - cum_tp
+    distinct = np.r_[np.nonzero(np.diff(s_sorted))[0], len(y) - 1]
+    tps, fps = np.r_[0, cum_tp[distinct]], np.r_[0, cum_fp[distinct]]
+
+    tpr = tps / pos if pos else np.zeros_like(tps, dtype=float)
+    fpr = fps / neg if neg else np.zeros_like(fps, dtype=float)
+    roc_auc = float(np.trapezoid(tpr, fpr)) if hasattr(np, 'trapezoid') else float(np.trapz(tpr, fpr))
+
+    predicted = tps + fps
+    precision = np.divide(tps, predicted, out=np.ones_like(tpr), where=predicted > 0)
+    recall = tpr
+    # Step-wise average precision (area under the PR curve without interpolation)
+    average_precision = float(np.sum(np.diff(recall) * precision[1:]))
+
+    # Threshold sweep: number of scores >= t via binary search on the ascending scores
+    ascending = s_sorted[::-1]
+    sweep = []
+    for t in thresholds:
+        called = len(s) - int(np.searchsorted(ascending, t, side='left'))
+        tp = int(cum_tp[called - 1]) if called else 0
+        fp, fn = called - tp, pos - tp
+        tn = neg - fp
+        prec = tp / called if called else 0.0
+        rec = tp / pos if pos else 0.0
+        sweep.append({
+            'threshold': float(t), 'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+            'precision': round(prec, 3), 'recall': round(rec, 3),
+            'specificity': round(tn / neg, 3) if neg else 0.0,
+            'f1': round(2 * prec * rec / (prec + rec), 3) if prec + rec else 0.0,
+            'accuracy': round((tp + tn) / len(y), 3),
+        })
+
+    # Reliability: mean predicted vs observed positive rate per equal-width score bin
+    edges = np.linspace(0, 1, n_bins + 1)
+    bin_of = np.minimum(np.searchsorted(edges, s, side='right') - 1, n_bins - 1)
+    counts = np.bincount(bin_of, minlength=n_bins)
+    predicted_sum = np.bincount(bin_of, weights=s, minlength=n_bins)
+    observed_sum = np.bincount(bin_of, weights=y, minlength=n_bins)
+    calibration = [{'bin': f"{edges[i]:.1f}-{edges[i + 1]:.1f}", 'count': int(counts[i]),
+                    'predicted': round(float(predicted_sum[i] / counts[i]), 3),
+                    'observed': round(float(observed_sum[i] / counts[i]), 3)}
+                   for i in range(n_bins) if counts[i]]
+
+    roc_fpr, roc_tpr = _thin(fpr, tpr)
+    pr_recall, pr_precision = _thin(recall[1:], precision[1:])
+    return {
+        'roc_auc': round(roc_auc, 4),
+        'average_precision': round(average_precision, 4),
+        'brier': round(float(np.mean((s - y) ** 2)), 4),
+        'roc': {'fpr': [round(v, 4) for v in roc_fpr], 'tpr': [round(v, 4) for v in roc_tpr]},
+        'pr': {'recall': [round(v, 4) for v in pr_recall], 'precision': [round(v, 4) for v in pr_precision]},
+        'thresholds': sweep,
+        'calibration': calibration,
+    }
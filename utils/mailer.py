@@ -0,0 +1,234 @@
+import os
+import time
+import uuid
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+import utils.db as db
+import utils.metrics as metrics
+
+# Outbound mail is queued in the `email_queue` table and delivered by background
+# workers, so request handlers only pay for one INSERT.
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', 1))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', 30))       # seconds, doubled per attempt
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', 5))  # picks up retries and other workers' rows
+MAIL_IDLE_TIMEOUT = float(os.getenv('MAIL_IDLE_TIMEOUT', 60))   # close the SMTP connection after this long idle
+MAIL_SMTP_TIMEOUT = float(os.getenv('MAIL_SMTP_TIMEOUT', 30))   # per blocking SMTP operation
+MAIL_KEEP_SENT_DAYS = float(os.getenv('MAIL_KEEP_SENT_DAYS', 7))  # redacted delivery records are purged after this
+# Worst case for one message: reconnect (connect, EHLO, STARTTLS, EHLO, AUTH) and send, each up to the timeout
+MESSAGE_BUDGET = 6 * MAIL_SMTP_TIMEOUT
+# A claimed message goes back to the queue if its worker has not renewed the lease by then
+# (renewed right before each send), so a crashed worker's mail is retried within minutes.
+# It must outlast sending one message, otherwise another worker could send it a second time.
+MAIL_LEASE = float(os.getenv('MAIL_LEASE', MESSAGE_BUDGET + 60))
+
+# Errors that concern a single message rather than the SMTP connection
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError, smtplib.SMTPNotSupportedError)
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+def enqueue_email(to_email, subject, html, preview=""):
+    """Queue a message for background delivery. `preview` is what dev mode prints instead of sending."""
+    conn = db.get_db_connection()
+    conn.execute("INSERT INTO email_queue (to_email, subject, html, preview, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                 (to_email, subject, html, preview, time.time()))
+    conn.commit()
+    conn.close()
+    start_mail_workers()
+    _wakeup.set()
+    return True
+
+def _claim_batch(claim_id):
+    """Atomically lease up to MAIL_BATCH_SIZE due messages to this worker (safe across processes)"""
+    now = time.time()
+    conn = db.get_db_connection()
+    conn.execute('''
+        UPDATE email_queue SET status = 'sending', claim = ?, locked_until = ?
+        WHERE id IN (
+            SELECT id FROM email_queue
+            WHERE (status = 'pending' AND next_attempt <= ?) OR (status = 'sending' AND locked_until < ?)
+            ORDER BY id LIMIT ?
+        )
+    ''', (claim_id, now + MAIL_LEASE, now, now, MAIL_BATCH_SIZE))
+    conn.commit()
+    rows = conn.execute("SELECT * FROM email_queue WHERE claim = ? AND status = 'sending' ORDER BY id", (claim_id,)).fetchall()
+    conn.close()
+    return rows
+
+def _still_claimed(row):
+    """Renew the lease on a message about to be sent; False if another worker took it over meanwhile"""
+    conn = db.get_db_connection()
+    renewed = conn.execute("UPDATE email_queue SET locked_until = ? WHERE id = ? AND claim = ? AND status = 'sending'",
+                           (time.time() + MAIL_LEASE, row['id'], row['claim'])).rowcount
+    conn.commit()
+    conn.close()
+    return renewed == 1
+
+# Sent and dead messages keep only delivery metadata: the body (OTP codes, risk results) is wiped
+_REDACT = "subject = '', html = '', preview = NULL"
+
+def _mark_sent(row):
+    conn = db.get_db_connection()
+    conn.execute(f"UPDATE email_queue SET status = 'sent', claim = NULL, sent_at = CURRENT_TIMESTAMP, {_REDACT} "
+                 "WHERE id = ? AND claim = ?", (row['id'], row['claim']))
+    conn.commit()
+    conn.close()
+
+def _release(rows, delay):
+    """Hand claimed messages back to the queue without counting an attempt"""
+    conn = db.get_db_connection()
+    conn.executemany("UPDATE email_queue SET status = 'pending', next_attempt = ?, claim = NULL WHERE id = ? AND claim = ?",
+                     [(time.time() + delay, row['id'], row['claim']) for row in rows])
+    conn.commit()
+    conn.close()
+
+def _mark_failed(row, error):
+    """Retry with exponential backoff; dead-letter after MAIL_MAX_ATTEMPTS"""
+    attempts = row['attempts'] + 1
+    status = 'dead' if attempts >= MAIL_MAX_ATTEMPTS else 'pending'
+    next_attempt = time.time() + MAIL_RETRY_BASE * (2 ** (attempts - 1))
+    redact = f", {_REDACT}" if status == 'dead' else ""
+    conn = db.get_db_connection()
+    conn.execute(f"UPDATE email_queue SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, claim = NULL{redact} "
+                 "WHERE id = ? AND claim = ?", (status, attempts, next_attempt, str(error)[:500], row['id'], row['claim']))
+    conn.commit()
+    conn.close()
+    metrics.inc('emails_failed_total', {'status': status})
+    if status == 'dead':
+        print(f"[Mail] Giving up on message {row['id']} to {row['to_email']} after {attempts} attempts: {error}")
+
+class SmtpConnection:
+    """An authenticated SMTP session kept open across messages and reopened on demand"""
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def get(self):
+        if self.server is not None and time.time() - self.last_used > MAIL_IDLE_TIMEOUT:
+            self.close()
+        if self.server is None:
+            server = smtplib.SMTP(os.getenv('EMAIL_SERVER', 'smtp.gmail.com'), int(os.getenv('EMAIL_PORT', 587)),
+                                  timeout=MAIL_SMTP_TIMEOUT)
+            server.ehlo()
+            if os.getenv('EMAIL_USE_TLS', '1') != '0' and server.has_extn('starttls'):
+                server.starttls()
+                server.ehlo()
+            if server.has_extn('auth'):
+                server.login(os.getenv('EMAIL_USER'), os.getenv('EMAIL_PASS'))
+            self.server = server
+        return self.server
+
+    def send(self, msg):
+        try:
+            self.get().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server dropped our idle connection: reconnect once
+            self.close()
+            self.get().send_message(msg)
+        self.last_used = time.time()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+def _deliver(row, smtp):
+    sender_email = os.getenv('EMAIL_USER')
+    sender_password = os.getenv('EMAIL_PASS')
+
+    # Developement Mode: If no credentials, log to console
+    if not sender_email or not sender_password:
+        print("\n" + "="*40)
+        print(f" [DEV] EMAIL SIMULATION - To: {row['to_email']}")
+        print(f" Subject: {row['subject']}")
+        if row['preview']:
+            print(f" {row['preview']}")
+        print("="*40 + "\n")
+        return
+
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = row['to_email']
+    msg['Subject'] = row['subject']
+    msg.attach(MIMEText(row['html'], 'html'))
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        smtp.send(msg)
+        outcome = 'sent'
+    finally:
+        metrics.observe('email_send_duration_seconds', time.perf_counter() - start, {'outcome': outcome})
+
+def purge_sent(days=MAIL_KEEP_SENT_DAYS):
+    """Delete delivery records of messages sent more than `days` ago"""
+    conn = db.get_db_connection()
+    conn.execute("DELETE FROM email_queue WHERE status = 'sent' AND sent_at < datetime('now', ?)", (f"-{days} days",))
+    conn.commit()
+    conn.close()
+
+def process_queue(claim_id, smtp):
+    """Deliver due messages batch by batch until none are left"""
+    while True:
+        batch = _claim_batch(claim_id)
+        if not batch:
+            return
+        for i, row in enumerate(batch):
+            if not _still_claimed(row):
+                continue
+            try:
+                _deliver(row, smtp)
+                _mark_sent(row)
+            except MESSAGE_ERRORS as e:
+                # The server rejected this message only; the connection is still usable
+                print(f"[Mail] Message {row['id']} rejected: {e}")
+                _mark_failed(row, e)
+            except Exception as e:
+                # Connection-level failure: back off instead of hammering the server with the rest of the batch
+                print(f"[Mail] Sending message {row['id']} failed: {e}")
+                smtp.close()
+                _mark_failed(row, e)
+                _release(batch[i + 1:], MAIL_RETRY_BASE)
+                return
+
+def _worker_loop():
+    smtp = SmtpConnection()
+    claim_id = uuid.uuid4().hex
+    while True:
+        _wakeup.wait(MAIL_POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            process_queue(claim_id, smtp)
+            purge_sent()
+            # Let the server drop us rather than holding a connection open forever
+            if smtp.server is not None and time.time() - smtp.last_used > MAIL_IDLE_TIMEOUT:
+                smtp.close()
+        except Exception as e:
+            print(f"[Mail] Worker Error: {e}")
+
+def start_mail_workers():
+    """Start the background delivery threads (once per process)"""
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(MAIL_WORKERS):
+            t = threading.Thread(target=_worker_loop, name=f'mail-worker-{i}', daemon=True)
+            t.start()
+            _workers.append(t)
+    # Drain anything left over from a previous run
+    _wakeup.set()
+
+def get_queue_stats():
+    conn = db.get_db_connection()
+    rows = conn.execute("SELECT status, COUNT(*) AS n FROM email_queue GROUP BY status").fetchall()
+    conn.close()
+    return {row['status']: row['n'] for row in rows}
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import glob
+import bisect
+import threading
+from functools import wraps
+
+# Lightweight Prometheus-style instrumentation.
+# Each process keeps its own counters; with METRICS_DIR set (e.g. under gunicorn) every
+# process also dumps a snapshot there and /metrics merges the snapshots of all workers:
+# counters and histograms are summed, gauges are reported per worker (pid label).
+# Snapshots are served as-is, so METRICS_DIR must be a private (0700) directory of this user.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'http_requests_total': 'HTTP requests by endpoint, method and status',
+    'http_request_duration_seconds': 'HTTP request latency by endpoint',
+    'db_queries_total': 'SQLite statements executed via utils.db',
+    'db_query_duration_seconds': 'SQLite statement latency by operation and table',
+    'predictor_duration_seconds': 'HeartDiseasePredictor call latency',
+    'ai_request_duration_seconds': 'LLM call latency by outcome',
+    'ai_first_chunk_seconds': 'Time to first streamed LLM chunk',
+    'email_send_duration_seconds': 'SMTP delivery latency by outcome',
+    'emails_failed_total': 'Failed deliveries by resulting queue status (pending = will retry, dead = gave up)',
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_gauges = {}      # name -> (help, fn returning a number or {labels dict as tuple: number})
+_callback_counters = {}  # name -> fn returning a monotonically increasing number
+_flusher = None
+_dir_warned = False
+# Counters and histograms of exited workers, kept so the merged totals never go down
+DEAD_SNAPSHOT = 'metrics_dead.json'
+
+def _key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def inc(name, labels=None, value=1):
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, labels=None):
+    key = (name, _key(labels))
+    idx = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 3)
+        h[idx] += 1            # non-cumulative here; made cumulative when rendering
+        h[-2] += seconds
+        h[-1] += 1
+
+class timed:
+    """Histogram timer usable as a decorator or context manager"""
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, self.labels)
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(self.name, time.perf_counter() - start, self.labels)
+        return wrapper
+
+def register_gauge(name, fn, help_text=''):
+    """fn is evaluated at scrape/flush time; it may return a number or a {labels_tuple: number} dict"""
+    _gauges[name] = (help_text, fn)
+
+def register_counter(name, fn, help_text=''):
+    """Counter kept elsewhere (e.g. cache hits); fn is read at scrape/flush time and summed across workers"""
+    HELP[name] = help_text or name
+    _callback_counters[name] = fn
+
+def snapshot():
+    with _lock:
+        counters = [[n, list(l), v] for (n, l), v in _counters.items()]
+        histograms = [[n, list(l), list(h)] for (n, l), h in _histograms.items()]
+    for name, fn in list(_callback_counters.items()):
+        try:
+            counters.append([name, [], fn()])
+        except Exception as e:
+            print(f"[Metrics] Counter {name} failed: {e}")
+    gauges = []
+    for name, (_, fn) in list(_gauges.items()):
+        try:
+            value = fn()
+        except Exception as e:
+            print(f"[Metrics] Gauge {name} failed: {e}")
+            continue
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        gauges.extend([name, list(l), v] for l, v in items)
+    return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+def _shared_dir():
+    """METRICS_DIR if it is set and private to this user, else None (metrics stay per process)"""
+    global _dir_warned
+    if not METRICS_DIR:
+        return None
+    from utils.assets import private_dir
+    if private_dir(METRICS_DIR):
+        return METRICS_DIR
+    if not _dir_warned:
+        _dir_warned = True
+        print(f"[Metrics] {METRICS_DIR} is not a private directory owned by this user; not sharing metrics")
+    return None
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"metrics_{pid}.json")
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def write_snapshot():
+    """Dump this process's metrics now (also called by a worker on its way out)"""
+    if _shared_dir():
+        _write_json(_snapshot_path(os.getpid()), snapshot())
+
+def start_flusher():
+    """Periodically dump this process's metrics to METRICS_DIR (no-op without it)"""
+    global _flusher
+    if _flusher is not None or not _shared_dir():
+        return
+
+    def _loop():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot()
+            except Exception as e:
+                print(f"[Metrics] Flush Error: {e}")
+
+    _flusher = threading.Thread(target=_loop, name='metrics-flush', daemon=True)
+    _flusher.start()
+
+def clear_snapshots():
+    """Remove snapshots of previous runs; call once before workers start"""
+    if _shared_dir():
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')):
+            os.remove(path)
+
+def retire_snapshot(pid):
+    """
+    An exited worker's gauges leave /metrics, but its counters and histograms are folded
+    into the dead-workers snapshot: dropping them would make the summed counters go down,
+    which Prometheus reads as a reset. Call from the master only (it is the single writer).
+    """
+    if not _shared_dir():
+        return
+    path = _snapshot_path(pid)
+    try:
+        with open(path) as f:
+            snap = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"[Metrics] Unreadable snapshot of worker {pid}: {e}")
+        snap = None
+    if snap:
+        dead_path = os.path.join(METRICS_DIR, DEAD_SNAPSHOT)
+        try:
+            with open(dead_path) as f:
+                dead = json.load(f)
+        except (OSError, ValueError):
+            dead = {'counters': [], 'histograms': [], 'gauges': []}
+        counters, histograms, _ = _merge([dead, snap])
+        _write_json(dead_path, {
+            'pid': None, 'gauges': [],
+            'counters': [[n, [list(p) for p in l], v] for (n, l), v in counters.items()],
+            'histograms': [[n, [list(p) for p in l], h] for (n, l), h in histograms.items()],
+        })
+    os.remove(path)
+
+def _collect():
+    """Snapshots of all processes, live and exited (or just this one without METRICS_DIR)"""
+    if not _shared_dir():
+        return [snapshot()]
+    write_snapshot()
+    snaps = []
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')):
+        try:
+            with open(path) as f:
+                snaps.append(json.load(f))
+        except (OSError, ValueError):
+            pass  # being rewritten right now
+    return snaps
+
+def _fmt_labels(labels, extra=None):
+    pairs = [(k, v) for k, v in labels] + (extra or [])
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+def _merge(snaps):
+    counters, histograms, gauges = {}, {}, {}
+    for snap in snaps:
+        for n, l, v in snap['counters']:
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0) + v
+        for n, l, h in snap['histograms']:
+            key = (n, tuple(map(tuple, l)))
+            merged = histograms.setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                merged[i] += v
+        # State gauges (breaker open, calls in flight) don't add up across workers: keep one series each
+        pid = snap.get('pid')
+        for n, l, v in snap['gauges']:
+            labels = tuple(map(tuple, l)) + ((('pid', pid),) if pid is not None else ())
+            gauges[(n, labels)] = v
+    return counters, histograms, gauges
+
+def render_prometheus():
+    counters, histograms, gauges = _merge(_collect())
+    lines = []
+    seen = set()
+    def header(name, kind, help_text):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter', HELP.get(name, name))
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), h in sorted(histograms.items()):
+        header(name, 'histogram', HELP.get(name, name))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, h):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h[-1]}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, 'gauge', _gauges.get(name, (name,))[0] or name)
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    """Record per-endpoint request counts and latency"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            observe('http_request_duration_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+            inc('http_requests_total', {'endpoint': endpoint, 'method': request.method, 'status': response.status_code})
+        return response
@@ -1,10 +1,17 @@
-import pandas as pd
-import numpy as np
-import joblib
 import os
+import time
+import hashlib
+import threading
 # Streamlit removed for production Flask app
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-from sklearn.model_selection import train_test_split
+# pandas, numpy, joblib and sklearn are imported where used: they dominate app import time
+import utils.metrics as metrics
+import utils.drift as drift
+
+# Probability above which an assessment is reported as High risk (pick it from the /insights threshold sweep)
+RISK_THRESHOLD = float(os.getenv('RISK_THRESHOLD', 0.5))
+
+# Model input columns, in the order the scaler was fitted on; age is in days
+FEATURES = ['age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo', 'cholesterol', 'gluc', 'smoke', 'alco', 'active', 'BMI']
 
 class HeartDiseasePredictor:
     def __init__(self, model_dir='.'):
@@ -23,9 +30,26 @@ class HeartDiseasePredictor:
             'Linear Regression': 'linear_regression.pkl'
         }
         
-        self._load_resources()
+        # Models are loaded on first use, or up front via preload()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._eval_lock = threading.Lock()
+        self._version = None
+
+    def preload(self):
+        """Load the scaler and models now (e.g. in the gunicorn master, before workers fork)"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._load_resources()
+                    self._loaded = True
+                    print(f"[Startup] Loaded {len(self.models)} models in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return self
 
     def _load_resources(self):
+        import joblib
+        
         # Load Scaler
         scaler_path = os.path.join(self.model_dir, 'cardio_model_scaler.pkl')
         if os.path.exists(scaler_path):
@@ -43,11 +67,68 @@ class HeartDiseasePredictor:
                 except Exception as e:
                     print(f"Failed to load {name}: {e}")
 
+    def primary_model_name(self):
+        """Name of the model used for live predictions"""
+        self.preload()
+        if 'Gradient Boosting' in self.models:
+            return 'Gradient Boosting'
+        return next(iter(self.models), None)
+
+    def model_version(self):
+        """Content hash of the live model and scaler; artefacts derived from them are rebuilt when it changes"""
+        if self._version is None:
+            digest = hashlib.sha1()
+            name = self.primary_model_name()
+            for filename in [self.model_files.get(name, ''), 'cardio_model_scaler.pkl']:
+                path = os.path.join(self.model_dir, filename)
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+            self._version = digest.hexdigest()[:12]
+        return self._version
+
+    def load_reference_data(self):
+        """
+        The reference dataset in model units: (features DataFrame in FEATURES order, target Series).
+        The CSV stores age in years while the models were trained on days.
+        """
+        import pandas as pd
+        df = pd.read_csv(self.data_path)
+        target_col = 'cardio' if 'cardio' in df.columns else df.columns[-1]
+        if 'BMI' not in df.columns:
+            df['BMI'] = df['weight'] / ((df['height'] / 100) ** 2)
+        df['age'] = df['age'] * 365
+        return df[FEATURES], df[target_col]
+
+    def to_frame(self, records):
+        """DataFrame in FEATURES order for input dicts (age in days), with BMI derived as in predict()"""
+        import pandas as pd
+        rows = []
+        for r in records:
+            height_m = r.get('height', 165) / 100.0
+            bmi = r.get('weight', 70) / (height_m ** 2)
+            rows.append([bmi if f == 'BMI' else r.get(f, 0) for f in FEATURES])
+        return pd.DataFrame(rows, columns=FEATURES)
+
+    def scale(self, df):
+        """Scaled feature matrix for a DataFrame with FEATURES columns"""
+        self.preload()
+        return self.scaler.transform(df[FEATURES]) if self.scaler else df[FEATURES].to_numpy()
+
+    def predict_proba_batch(self, df):
+        """Risk probabilities of the primary model for a DataFrame with FEATURES columns"""
+        self.preload()
+        model = self.models[self.primary_model_name()]
+        return model.predict_proba(self.scale(df))[:, 1]
+
+    @metrics.timed('predictor_duration_seconds', {'op': 'evaluate_models'})
     def evaluate_models(self):
         """
         Dynamically calculate metrics for all loaded models using the provided CSV.
         Returns a dict of stats and list of model comparisons.
         """
+        self.preload()
+        
         # Default/Fallback stats if specific files aren't found
         default_stats = {
             'main_model': 'Random Forest (Demo)',
@@ -71,81 +152,75 @@ class HeartDiseasePredictor:
         if self.metrics_cache:
             return self.metrics_cache['stats'], self.metrics_cache['comparison']
 
-        try:
-            # Load Data
-            df = pd.read_csv(self.data_path)
-            
-            # Assume target is 'cardio' or last column
-            target_col = 'cardio' if 'cardio' in df.columns else df.columns[-1]
-            
-            # Feature Engineering: BMI is required by the trained model
-            if 'BMI' not in df.columns and 'weight' in df.columns and 'height' in df.columns:
-                # height in cm, weight in kg -> BMI = kg / m^2
-                df['BMI'] = df['weight'] / ((df['height'] / 100) ** 2)
+        with self._eval_lock:
+            if not self.metrics_cache:
+                self.metrics_cache = self._evaluate(default_stats, default_comparison)
+        return self.metrics_cache['stats'], self.metrics_cache['comparison']
 
-            X = df.drop(columns=[target_col])
-            
-            y = df[target_col]
+    def _model_scores(self, model, X_scaled):
+        """Positive-class scores in [0, 1]; models trained without BMI take the first 11 scaled columns"""
+        import numpy as np
+        X = X_scaled[:, :getattr(model, 'n_features_in_', X_scaled.shape[1])]
+        if hasattr(model, 'predict_proba'):
+            return model.predict_proba(X)[:, 1]
+        return np.clip(model.predict(X), 0.0, 1.0)  # e.g. Linear Regression
+
+    def _evaluate(self, default_stats, default_comparison):
+        from sklearn.model_selection import train_test_split
+        from utils.evaluation import curve_metrics, THRESHOLDS
+        try:
+            X, y = self.load_reference_data()
             
-            # Use a subset for speed if dataset is huge, or train_test_split
-            if len(df) > 10000:
-                 _, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+            # Held-out split for speed on large datasets
+            if len(X) > 10000:
+                _, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             else:
                 X_test, y_test = X, y
+            X_test_scaled = self.scale(X_test)
+            thresholds = sorted(set(THRESHOLDS.tolist()) | {RISK_THRESHOLD})
 
-            # Validate Feature Alignment
-            # (Assuming CSV columns match model expectation, simplified here)
-            
-            if self.scaler:
-                X_test_scaled = self.scaler.transform(X_test)
-            else:
-                X_test_scaled = X_test
+            # One sort of the scores per model gives every curve and every threshold's confusion matrix
+            comparison = []
+            for name, model in self.models.items():
+                curves = curve_metrics(y_test, self._model_scores(model, X_test_scaled), thresholds=thresholds)
+                op = next(t for t in curves['thresholds'] if t['threshold'] == RISK_THRESHOLD)
+                comparison.append({
+                    'name': name,
+                    'acc': round(op['accuracy'] * 100, 1),
+                    'prec': round(op['precision'], 2),
+                    'recall': round(op['recall'], 2),
+                    'f1': round(op['f1'], 2),
+                    'roc_auc': round(curves['roc_auc'], 3),
+                    'ap': round(curves['average_precision'], 3),
+                    'brier': round(curves['brier'], 3),
+                    'curves': curves,
+                })
 
-            main_model_name = 'Gradient Boosting' if 'Gradient Boosting' in self.models else list(self.models.keys())[0]
-            main_model = self.models[main_model_name]
-            
-            # Calculate Main Model Stats
-            y_pred_main = main_model.predict(X_test_scaled)
-            y_prob_main = main_model.predict_proba(X_test_scaled)[:, 1] if hasattr(main_model, 'predict_proba') else y_pred_main
-            
+            main_model_name = self.primary_model_name()
+            main = next(c for c in comparison if c['name'] == main_model_name)
             stats = {
                 'main_model': main_model_name,
-                'accuracy': round(accuracy_score(y_test, y_pred_main) * 100, 1),
-                'roc_auc': round(roc_auc_score(y_test, y_prob_main), 2),
-                'dataset_size': f"{len(df):,}",
-                'features': X.shape[1]
+                'accuracy': main['acc'],
+                'roc_auc': round(main['roc_auc'], 2),
+                'dataset_size': f"{len(X):,}",
+                'features': X.shape[1],
+                'threshold': RISK_THRESHOLD,
             }
 
-            # Comparison Loop
-            comparison = []
-            for name, model in self.models.items():
-                y_pred = model.predict(X_test_scaled)
-                
-                # Robustness for Linear Regression or non-classifier models
-                if hasattr(y_pred, 'dtype') and (y_pred.dtype == float or y_pred.dtype == np.float64) and len(np.unique(y_pred)) > 2:
-                    y_pred = (y_pred > 0.5).astype(int)
-
-                comp_entry = {
-                    'name': name,
-                    'acc': round(accuracy_score(y_test, y_pred) * 100, 1),
-                    'prec': round(precision_score(y_test, y_pred), 2),
-                    'recall': round(recall_score(y_test, y_pred), 2),
-                    'f1': round(f1_score(y_test, y_pred), 2)
-                }
-                comparison.append(comp_entry)
-
             # Sort by accuracy descending
             comparison.sort(key=lambda x: x['acc'], reverse=True)
-            
-            # Cache results
-            self.metrics_cache = {'stats': stats, 'comparison': comparison}
-            return stats, comparison
+            return {'stats': stats, 'comparison': comparison}
 
         except Exception as e:
+            # Cached too: the inputs don't change while the process runs
             print(f"Evaluation Error: {e}")
-            return default_stats, default_comparison
+            return {'stats': default_stats, 'comparison': default_comparison}
 
+    @metrics.timed('predictor_duration_seconds', {'op': 'predict'})
     def predict(self, input_data):
+        import pandas as pd
+        self.preload()
+        
         # Feature order matches typical Cardio dataset
         features = ['age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo', 'cholesterol', 'gluc', 'smoke', 'alco', 'active']
         
@@ -176,8 +251,12 @@ class HeartDiseasePredictor:
             df = pd.DataFrame([input_data], columns=features)
             df['BMI'] = df['weight'] / ((df['height'] / 100) ** 2)
 
+        # Track the assembled feature row (derived BMI included) against the training
+        # distribution (in-memory, O(1) per feature)
+        drift.observe(self, df.iloc[0].to_dict())
+
         # Use Gradient Boosting as primary, or first available
-        model = self.models.get('Gradient Boosting', next(iter(self.models.values())) if self.models else None)
+        model = self.models.get(self.primary_model_name())
         
         if model:
             # Some models might need specific column ordering or subset.
@@ -209,7 +288,7 @@ class HeartDiseasePredictor:
             if input_data.get('cholesterol', 1) > 1: score += 0.2
             import random
             prob = 0.1 + score + (random.random() * 0.1)
-            return (1 if prob > 0.5 else 0), min(prob, 0.99)
+            return (1 if prob > RISK_THRESHOLD else 0), min(prob, 0.99)
 
     def get_lifestyle_suggestions(self, prob):
         if prob < 0.3:
@@ -0,0 +1,90 @@
+"""
+"Similar profiles": outcomes of the nearest reference records to an assessment.
+
+A KDTree over the scaled reference features (same scaler and BMI derivation as the
+predictor) is built once, saved uncompressed with joblib and memory-mapped on load, so
+every worker shares the same read-only pages. Queries take a batch of rows at once.
+
+    python -m utils.neighbors          # (re)build the index
+"""
+import os
+import sys
+import time
+import threading
+import utils.metrics as metrics
+
+SIMILAR_INDEX_PATH = os.getenv('SIMILAR_INDEX_PATH', 'similar_profiles.joblib')
+SIMILAR_K = int(os.getenv('SIMILAR_K', 200))
+
+_index = None
+_lock = threading.Lock()
+
+class NeighborIndex:
+    def __init__(self, version, tree, outcomes):
+        self.version = version
+        self.tree = tree
+        self.outcomes = outcomes  # int8 target per reference row, aligned with the tree data
+
+    def query(self, X_scaled, k=SIMILAR_K):
+        """For each scaled row: {'k', 'rate' (% with the disease), 'distance' (mean)}"""
+        k = min(k, len(self.outcomes))
+        dist, idx = self.tree.query(X_scaled, k=k)
+        rates = self.outcomes[idx].mean(axis=1) * 100
+        return [{'k': k, 'rate': round(float(r), 1), 'distance': round(float(d), 3)}
+                for r, d in zip(rates, dist.mean(axis=1))]
+
+def build_index(predictor, path=SIMILAR_INDEX_PATH):
+    import joblib
+    import numpy as np
+    from sklearn.neighbors import KDTree
+    start = time.perf_counter()
+    X, y = predictor.load_reference_data()
+    tree = KDTree(np.ascontiguousarray(predictor.scale(X), dtype=np.float64), leaf_size=40)
+    index = NeighborIndex(predictor.model_version(), tree, y.to_numpy().astype(np.int8))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump({'version': index.version, 'tree': tree, 'outcomes': index.outcomes}, tmp)
+    os.replace(tmp, path)
+    print(f"[Neighbors] Indexed {len(X):,} reference profiles in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return index
+
+def load_index(path=SIMILAR_INDEX_PATH):
+    import joblib
+    if not os.path.exists(path):
+        return None
+    data = joblib.load(path, mmap_mode='r')
+    return NeighborIndex(data['version'], data['tree'], data['outcomes'])
+
+def get_index(predictor):
+    """The current index, loaded from disk or rebuilt if missing or built for another model"""
+    global _index
+    version = predictor.model_version()
+    if _index is not None and _index.version == version:
+        return _index
+    with _lock:
+        if _index is None or _index.version != version:
+            try:
+                index = load_index()
+            except Exception as e:
+                print(f"[Neighbors] Load Error: {e}")
+                index = None
+            if index is None or index.version != version:
+                index = build_index(predictor)
+            _index = index
+    return _index
+
+@metrics.timed('predictor_duration_seconds', {'op': 'similar_profiles'})
+def similar_profiles(predictor, records, k=SIMILAR_K):
+    """Outcome summary of the k most similar reference records for each input dict, or None"""
+    if not os.path.exists(predictor.data_path) or not predictor.models:
+        return None
+    try:
+        index = get_index(predictor)
+        return index.query(predictor.scale(predictor.to_frame(records)), k=k)
+    except Exception as e:
+        print(f"[Neighbors] Query Error: {e}")
+        return None
+
+if __name__ == '__main__':
+    from utils.models import HeartDiseasePredictor
+    build_index(HeartDiseasePredictor())
+    sys.exit(0)
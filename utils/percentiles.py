@@ -0,0 +1,137 @@
+"""
+Population risk percentiles.
+
+The reference dataset is scored once with the live model; the probabilities are kept as
+sorted float32 arrays per (age band, gender) in a small .npz next to the models, tagged
+with the model version. A lookup is a binary search into one array.
+
+    python -m utils.percentiles          # (re)build the index
+"""
+import os
+import sys
+import time
+import threading
+import utils.metrics as metrics
+
+PERCENTILE_INDEX_PATH = os.getenv('PERCENTILE_INDEX_PATH', 'risk_percentiles.npz')
+# Age band lower bounds in years: <40, 40-49, 50-59, 60+
+AGE_BANDS = (0, 40, 50, 60)
+# Strata smaller than this fall back to the gender-only, then whole-population array
+MIN_STRATUM = 200
+
+GENDERS = {1: 'women', 2: 'men'}
+
+_index = None
+_lock = threading.Lock()
+
+def age_band(age_years):
+    band = AGE_BANDS[0]
+    for lower in AGE_BANDS:
+        if age_years >= lower:
+            band = lower
+    return band
+
+def band_label(band):
+    i = AGE_BANDS.index(band)
+    if i == 0:
+        return f"under {AGE_BANDS[1]}"
+    if i == len(AGE_BANDS) - 1:
+        return f"{band} and over"
+    return f"{band}-{AGE_BANDS[i + 1] - 1}"
+
+class PercentileIndex:
+    def __init__(self, version, arrays):
+        self.version = version
+        self.arrays = arrays  # key -> sorted float32 probabilities
+
+    def _stratum(self, age_years, gender):
+        for key in (f"a{age_band(age_years)}_g{gender}", f"g{gender}", 'all'):
+            arr = self.arrays.get(key)
+            if arr is not None and len(arr) >= MIN_STRATUM:
+                return key, arr
+        return 'all', self.arrays['all']
+
+    def lookup(self, prob, age_years, gender):
+        """
+        Share of the reference population (same age band and gender where possible) with a
+        lower predicted risk, as {'percentile', 'group', 'size'}.
+        """
+        import numpy as np
+        key, arr = self._stratum(age_years, gender)
+        below = int(np.searchsorted(arr, prob, side='left'))
+        if key.startswith('a') and key != 'all':
+            group = f"{GENDERS.get(gender, 'people')} aged {band_label(age_band(age_years))}"
+        elif key.startswith('g'):
+            group = GENDERS.get(gender, 'people')
+        else:
+            group = 'people'
+        return {'percentile': round(100.0 * below / len(arr), 1), 'group': group, 'size': len(arr)}
+
+def build_index(predictor, path=PERCENTILE_INDEX_PATH):
+    """Score the reference dataset and write the sorted per-stratum arrays"""
+    import numpy as np
+    start = time.perf_counter()
+    X, _ = predictor.load_reference_data()
+    probs = predictor.predict_proba_batch(X).astype(np.float32)
+    ages = X['age'].to_numpy() / 365
+    genders = X['gender'].to_numpy()
+    bands = np.array(AGE_BANDS)[np.searchsorted(AGE_BANDS, ages, side='right') - 1]
+
+    arrays = {'all': np.sort(probs)}
+    for gender in np.unique(genders):
+        arrays[f"g{gender}"] = np.sort(probs[genders == gender])
+        for band in AGE_BANDS:
+            mask = (genders == gender) & (bands == band)
+            if mask.any():
+                arrays[f"a{band}_g{gender}"] = np.sort(probs[mask])
+
+    version = predictor.model_version()
+    # Per-process temp name: workers building at the same time must not share a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, __version__=np.array(version), **arrays)
+    os.replace(tmp, path)
+    print(f"[Percentiles] Indexed {len(probs):,} reference scores in {len(arrays)} strata "
+          f"({(time.perf_counter() - start) * 1000:.0f} ms, model {version})")
+    return PercentileIndex(version, arrays)
+
+def load_index(path=PERCENTILE_INDEX_PATH):
+    import numpy as np
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        arrays = {k: data[k] for k in data.files if k != '__version__'}
+        return PercentileIndex(str(data['__version__']), arrays)
+
+def get_index(predictor):
+    """The current index, loaded from disk or rebuilt if missing or built for another model"""
+    global _index
+    version = predictor.model_version()
+    if _index is not None and _index.version == version:
+        return _index
+    with _lock:
+        if _index is None or _index.version != version:
+            try:
+                index = load_index()
+            except Exception as e:
+                print(f"[Percentiles] Load Error: {e}")
+                index = None
+            if index is None or index.version != version:
+                index = build_index(predictor)
+            _index = index
+    return _index
+
+@metrics.timed('predictor_duration_seconds', {'op': 'percentile'})
+def risk_percentile(predictor, prob, age_years, gender):
+    """Percentile info for a prediction, or None if the index can't be built"""
+    if not os.path.exists(predictor.data_path) or not predictor.models:
+        return None
+    try:
+        return get_index(predictor).lookup(prob, age_years, gender)
+    except Exception as e:
+        print(f"[Percentiles] Lookup Error: {e}")
+        return None
+
+if __name__ == '__main__':
+    from utils.models import HeartDiseasePredictor
+    build_index(HeartDiseasePredictor())
+    sys.exit(0)
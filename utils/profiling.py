@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import glob
+import pstats
+import random
+import cProfile
+import datetime
+import threading
+from flask import g, request, session
+
+# Opt-in request profiling. A request is profiled when an admin sends "X-Profile: 1"
+# (or ?__profile=1), or at random for a PROFILE_SAMPLE_RATE fraction of traffic.
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
+
+# Self time is attributed to these buckets by source file / C function name
+CATEGORIES = [
+    ('sqlite', ('sqlite3',)),
+    ('json', ('/json/', 'json.')),
+    ('pandas', ('/pandas/',)),
+    ('jinja', ('/jinja2/',)),
+    ('sklearn', ('/sklearn/', '/numpy/')),
+]
+
+# cProfile can't run two profilers at once (3.12+), so profile one request at a time per process
+_busy = threading.Lock()
+
+def _wants_profile():
+    if session.get('role') == 'admin' and (request.headers.get('X-Profile') == '1' or request.args.get('__profile') == '1'):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _categorize(stats):
+    totals = {name: 0.0 for name, _ in CATEGORIES}
+    for (filename, _, funcname), (_, _, tottime, _, _) in stats.stats.items():
+        where = f"{filename} {funcname}"
+        for name, needles in CATEGORIES:
+            if any(n in where for n in needles):
+                totals[name] += tottime
+                break
+    return {name: round(t * 1000, 2) for name, t in totals.items()}
+
+def _top_functions(stats, limit=25):
+    rows = []
+    for (filename, lineno, funcname), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{lineno}({funcname})" if filename != '~' else funcname,
+            'calls': ncalls,
+            'self_ms': round(tottime * 1000, 2),
+            'cum_ms': round(cumtime * 1000, 2),
+        })
+    rows.sort(key=lambda r: r['cum_ms'], reverse=True)
+    return rows[:limit]
+
+def _save(profiler, duration, response):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = datetime.datetime.now()
+    profile_id = f"{now.strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+
+    stats = pstats.Stats(profiler)
+    meta = {
+        'id': profile_id,
+        'endpoint': request.endpoint or 'unmatched',
+        'path': request.full_path.rstrip('?'),
+        'method': request.method,
+        'status': response.status_code,
+        'user': session.get('user'),
+        'duration_ms': round(duration * 1000, 1),
+        'timestamp': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'breakdown': _categorize(stats),
+        'top': _top_functions(stats),
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), 'w') as f:
+        json.dump(meta, f)
+    _rotate()
+    return profile_id
+
+def _rotate():
+    """Keep only the newest PROFILE_KEEP captures"""
+    metas = sorted(glob.glob(os.path.join(PROFILE_DIR, '*.json')))
+    for path in metas[:-PROFILE_KEEP] if len(metas) > PROFILE_KEEP else []:
+        for stale in (path, path[:-5] + '.prof'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def list_profiles(limit=50):
+    """Captured requests, slowest first"""
+    profiles = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, '*.json')):
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop('top', None)
+        profiles.append(meta)
+    profiles.sort(key=lambda p: p['duration_ms'], reverse=True)
+    return profiles[:limit]
+
+def load_profile(profile_id):
+    path = os.path.join(PROFILE_DIR, f"{os.path.basename(profile_id)}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def init_app(app):
+    @app.before_request
+    def _start_profile():
+        if not _wants_profile() or not _busy.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        g._profile = (profiler, time.perf_counter())
+        profiler.enable()
+
+    @app.after_request
+    def _finish_profile(response):
+        active = g.pop('_profile', None)
+        if active is None:
+            return response
+        profiler, start = active
+        profiler.disable()
+        duration = time.perf_counter() - start
+        try:
+            response.headers['X-Profile-Id'] = _save(profiler, duration, response)
+        except Exception as e:
+            print(f"[Profile] Save Error: {e}")
+        finally:
+            _busy.release()
+        return response
+
+    @app.teardown_request
+    def _abort_profile(exc):
+        # after_request is skipped on unhandled errors; don't leave the profiler running
+        active = g.pop('_profile', None)
+        if active is not None:
+            active[0].disable()
+            _busy.release()
@@ -0,0 +1,205 @@
+import os
+import time
+import sqlite3
+import threading
+from flask import request, session, Response
+from werkzeug.exceptions import HTTPException
+
+# Per-endpoint limits for POST requests: endpoint -> (requests, per seconds).
+# Override with RATE_LIMITS="chat=20/60,login=5/60".
+DEFAULT_LIMITS = {
+    'login': (10, 60),
+    'register': (5, 60),
+    'chat': (20, 60),
+    'chat_stream': (20, 60),
+    'predictor_stage1': (30, 60),
+    'predictor_stage2': (30, 60),
+}
+# Per-IP buckets allow this many times the per-user limit, since many users can share one
+# address (NAT, office networks). Override single endpoints with RATE_LIMITS_IP="login=30/60".
+RATE_LIMIT_IP_FACTOR = float(os.getenv('RATE_LIMIT_IP_FACTOR', 5))
+# 'memory' keeps buckets per process; 'sqlite' shares them between gunicorn workers
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'ratelimit.db')
+# Use the first X-Forwarded-For hop as client IP (only behind a trusted proxy, e.g. Render/Heroku)
+RATE_LIMIT_TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', '0') == '1'
+# Requests handled at once per process; extra requests wait ADMISSION_WAIT seconds, then get a 503
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 64))
+ADMISSION_WAIT = float(os.getenv('ADMISSION_WAIT', 2))
+
+def parse_limits(spec, defaults=DEFAULT_LIMITS):
+    limits = dict(defaults)
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        endpoint, rule = item.split('=')
+        count, seconds = rule.split('/')
+        limits[endpoint.strip()] = (int(count), float(seconds))
+    return limits
+
+def ip_defaults(limits):
+    """Per-IP limits: the per-user limits scaled by RATE_LIMIT_IP_FACTOR"""
+    return {endpoint: (max(1, int(count * RATE_LIMIT_IP_FACTOR)), seconds)
+            for endpoint, (count, seconds) in limits.items()}
+
+class MemoryBuckets:
+    """Token buckets kept in this process"""
+    def __init__(self, max_keys=100000):
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+
+    def take(self, key, capacity, refill_per_sec):
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_sec)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_per_sec)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / refill_per_sec
+
+    def _prune(self, now):
+        # A bucket that has refilled to capacity is the same as a missing one, whatever its rate
+        self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+
+class SqliteBuckets:
+    """
+    Token buckets in a small SQLite file, shared by every worker on the host.
+    If the file is locked or unusable, requests are let through rather than failed.
+    """
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path, timeout=1):
+        self.path = path
+        self.timeout = timeout
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)")
+        if 'full_at' not in [col[1] for col in conn.execute("PRAGMA table_info(buckets)")]:
+            conn.execute("ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_full_at ON buckets (full_at)")
+        conn.commit()
+        conn.close()
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, refill_per_sec):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * refill_per_sec)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                             (key, tokens, now, now + (capacity - tokens) / refill_per_sec))
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"[RateLimit] Bucket store unavailable, allowing request: {e}")
+            return True, 0
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_INTERVAL
+            self.prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / refill_per_sec
+
+    def prune(self, now=None):
+        """Drop buckets that have refilled to capacity; a missing bucket starts full anyway"""
+        try:
+            self._conn().execute("DELETE FROM buckets WHERE full_at <= ?", (time.time() if now is None else now,))
+        except sqlite3.Error as e:
+            print(f"[RateLimit] Pruning buckets failed: {e}")
+
+def _too_many(retry_after):
+    return Response("Too many requests. Please slow down.", status=429,
+                    headers={'Retry-After': str(max(1, int(retry_after + 0.999)))}, mimetype='text/plain')
+
+class AdmissionControl:
+    """
+    WSGI middleware in front of Flask: caps concurrent requests and applies per-IP buckets
+    before the session is loaded or any route code runs.
+    """
+    def __init__(self, wsgi_app, flask_app, buckets, limits):
+        """`limits` are the per-IP limits, endpoint -> (requests, per seconds)"""
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+        self.buckets = buckets
+        self.limits = limits
+        self.slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+    def _client_ip(self, environ):
+        if RATE_LIMIT_TRUST_PROXY and environ.get('HTTP_X_FORWARDED_FOR'):
+            return environ['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
+        return environ.get('REMOTE_ADDR', '?')
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'POST':
+            try:
+                endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match(method='POST')
+            except HTTPException:
+                endpoint = None
+            if endpoint in self.limits:
+                count, seconds = self.limits[endpoint]
+                allowed, retry_after = self.buckets.take(f"ip:{endpoint}:{self._client_ip(environ)}", count, count / seconds)
+                if not allowed:
+                    return _too_many(retry_after)(environ, start_response)
+
+        if not self.slots.acquire(timeout=ADMISSION_WAIT):
+            print("[Admission] Shedding request: server at capacity")
+            return Response("Server busy, please retry shortly.", status=503,
+                            headers={'Retry-After': '1'}, mimetype='text/plain')(environ, start_response)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            self.slots.release()
+            raise
+        # Hold the slot until the body is fully sent (matters for streamed responses)
+        return _ReleasingIterable(body, self.slots.release)
+
+class _ReleasingIterable:
+    def __init__(self, body, release):
+        self.body = body
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.release()
+
+def init_app(app):
+    """Install admission control and per-user buckets on the Flask app"""
+    limits = parse_limits(os.getenv('RATE_LIMITS'))
+    ip_limits = parse_limits(os.getenv('RATE_LIMITS_IP'), ip_defaults(limits))
+    buckets = SqliteBuckets(RATE_LIMIT_DB) if RATE_LIMIT_BACKEND == 'sqlite' else MemoryBuckets()
+    app.wsgi_app = AdmissionControl(app.wsgi_app, app, buckets, ip_limits)
+
+    @app.before_request
+    def limit_per_user():
+        if request.method != 'POST' or request.endpoint not in limits or 'user' not in session:
+            return None
+        count, seconds = limits[request.endpoint]
+        allowed, retry_after = buckets.take(f"user:{request.endpoint}:{session['user']}", count, count / seconds)
+        if not allowed:
+            return _too_many(retry_after)
@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Words that tie a prompt to the asker's own data or to the conversation so far
+_PERSONAL_RE = re.compile(r"\b(i|i'm|im|i've|ive|me|my|mine|myself|we|our|us|am|result|results|report|score|"
+                          r"reading|readings|assessment)\b")
+_FOLLOW_UP_RE = re.compile(r"\b(it|its|it's|this|that|these|those|they|them|their|he|she|his|her|above|earlier|"
+                           r"previous|again|also|else|more|another|same|what about|how about)\b")
+FAQ_MIN_WORDS = 3
+_PUNCT_RE = re.compile(r"[^\w\s']")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_prompt(prompt):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key"""
+    text = _PUNCT_RE.sub(' ', prompt.lower())
+    return _SPACE_RE.sub(' ', text).strip()
+
+def is_faq(prompt):
+    """
+    True for a self-contained general question ("What is a healthy blood pressure?") that can
+    be answered without the user's profile or conversation, and so shares one cache entry.
+    """
+    normalized = normalize_prompt(prompt)
+    return (len(normalized.split()) >= FAQ_MIN_WORDS
+            and not _PERSONAL_RE.search(normalized) and not _FOLLOW_UP_RE.search(normalized))
+
+def make_key(prompt, context_fields=None):
+    """
+    Build a cache key from the normalized prompt.
+    A reply generated with any user context (identity, profile, latest assessment, recent
+    conversation) is keyed on a hash of all of it, so it is only ever served back to the
+    same user in the same conversation state. Only context-free replies share a key.
+    Returns (key, scope) where scope is 'generic' or 'personal'.
+    """
+    normalized = normalize_prompt(prompt)
+    if not context_fields:
+        return f"generic:{normalized}", 'generic'
+    fields = json.dumps(context_fields, sort_keys=True, default=str)
+    digest = hashlib.sha1(fields.encode()).hexdigest()[:16]
+    return f"personal:{digest}:{normalized}", 'personal'
+
+class ResponseCache:
+    """
+    In-memory LRU with per-entry TTL, optionally backed by a SQLite table
+    so entries survive restarts and are shared between workers.
+    """
+    def __init__(self, max_entries=512, ttl=86400, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if db_path:
+            conn = sqlite3.connect(db_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        value = self._load(key, now) if self.db_path else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put(key, expires, value)
+        if self.db_path:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                conn.execute("INSERT OR REPLACE INTO ai_response_cache (key, response, expires) VALUES (?, ?, ?)",
+                             (key, value, expires))
+                conn.commit()
+                conn.close()
+            except Exception as e:
+                print(f"[AI Cache] Persist Error: {e}")
+
+    def _put(self, key, expires, value):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key, now):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute("SELECT response, expires FROM ai_response_cache WHERE key = ? AND expires > ?",
+                               (key, now)).fetchone()
+            conn.close()
+        except Exception as e:
+            print(f"[AI Cache] Load Error: {e}")
+            return None
+        if not row:
+            return None
+        with self._lock:
+            self._put(key, row[1], row[0])
+        return row[0]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'size': len(self._entries),
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
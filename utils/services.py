@@ -1,62 +1,148 @@
-from google import genai
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
+import threading
+import queue
+from concurrent.futures import TimeoutError as FutureTimeout
+from utils.resilience import BoundedExecutor, CircuitBreaker, Overloaded
+from utils.response_cache import ResponseCache, make_key
+from utils.mailer import enqueue_email
+import utils.metrics as metrics
 
 # --- AI Service ---
-def get_ai_response(prompt, context=""):
-    """
-    Get response from Gemini API.
-    Fallback to simple rules if key not found.
-    """
-    api_key = os.getenv('GOOGLE_API_KEY')
-    
-    args = {}
-    if api_key:
-        print(f"[AI Debug] Found API Key: {api_key[:5]}...")
-    else:
-        print("[AI Debug] No API Key found in env!")
-        return "I'm sorry, I'm not fully connected to the cloud right now. Please check my configuration."
+FALLBACK_MESSAGE = "I'm sorry, I'm not fully connected to the cloud right now. Please check my configuration."
+ERROR_MESSAGE = "I'm having trouble thinking right now. Please try again in a moment."
+
+# 'gemini' (default) or 'fake' for an offline, deterministic streaming backend
+AI_BACKEND = os.getenv('AI_BACKEND', 'gemini')
+AI_FAKE_DELAY = float(os.getenv('AI_FAKE_DELAY', 0.05))
+# Pin a model and skip discovery entirely, e.g. AI_MODEL=gemini-2.5-flash
+AI_MODEL = os.getenv('AI_MODEL')
+# Seconds a discovered model name stays fresh before a background refresh
+AI_MODEL_TTL = int(os.getenv('AI_MODEL_TTL', 3600))
+# Point the SDK at another endpoint (e.g. a local stub of the API)
+AI_BASE_URL = os.getenv('AI_BASE_URL')
+DEFAULT_MODEL = 'gemini-2.5-flash' # Guess for 2026
+
+# Guard rails so a slow or failing upstream can't tie up every web worker
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', 20))                   # seconds per call (per chunk when streaming)
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 8))      # AI calls running at once per process
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', 8))                  # calls allowed to wait for a slot
+AI_RETRIES = int(os.getenv('AI_RETRIES', 0))                      # extra attempts after an error
+AI_RETRY_MIN_BUDGET = float(os.getenv('AI_RETRY_MIN_BUDGET', 3))  # don't retry with less time left than this
+
+ai_executor = BoundedExecutor(AI_MAX_CONCURRENCY, AI_MAX_QUEUE, name='ai-call')
+ai_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('AI_BREAKER_FAILURES', 5)),
+    reset_timeout=float(os.getenv('AI_BREAKER_RESET', 30))
+)
+
+# Repeated questions (FAQs) are answered from cache instead of a new LLM call.
+# Set AI_CACHE_DB (e.g. heartguard.db) to persist entries across restarts and workers.
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('AI_CACHE_SIZE', 512)),
+    ttl=int(os.getenv('AI_CACHE_TTL', 86400)),
+    db_path=os.getenv('AI_CACHE_DB')
+)
 
+metrics.register_gauge('ai_inflight_calls', lambda: ai_executor.inflight, 'LLM calls currently running or queued')
+metrics.register_gauge('ai_circuit_open', lambda: int(ai_breaker.state != 'closed'), '1 while the AI circuit breaker is open or half-open')
+metrics.register_gauge('ai_cache_entries', lambda: response_cache.stats()['size'], 'Entries in the in-memory AI response cache')
+metrics.register_counter('ai_cache_hits_total', lambda: response_cache.stats()['hits'], 'AI response cache hits')
+metrics.register_counter('ai_cache_misses_total', lambda: response_cache.stats()['misses'], 'AI response cache misses')
+
+def _record_ai(start, outcome):
+    metrics.observe('ai_request_duration_seconds', time.monotonic() - start, {'outcome': outcome})
+
+_client = None
+_client_lock = threading.Lock()
+_model_cache = {'name': None, 'expires': 0.0, 'refreshing': False}
+_model_lock = threading.Lock()
+
+def _get_client():
+    """One long-lived client per process so the HTTP connection pool (and TLS session) is reused"""
+    global _client
+    if _client is None:
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            return None
+        with _client_lock:
+            if _client is None:
+                # Imported here: the SDK is slow to import and only chat needs it
+                from google import genai
+                from google.genai import types
+                # The HTTP timeout makes abandoned calls on ai_executor finish too
+                http_options = types.HttpOptions(timeout=int(AI_TIMEOUT * 1000))
+                if AI_BASE_URL:
+                    http_options.base_url = AI_BASE_URL
+                _client = genai.Client(api_key=api_key, http_options=http_options)
+    return _client
+
+def _discover_model(client):
+    """Find a valid 'flash' model via dynamic discovery. Returns None if listing fails."""
+    # 2026 Dynamic Discovery: Find a valid 'flash' model
+    # Hardcoding fails because 1.5 might be retired in 2026.
+    all_models = []
     try:
-        # New SDK Initialization
-        client = genai.Client(api_key=api_key)
-        
-        # 2026 Dynamic Discovery: Find a valid 'flash' model
-        # Hardcoding fails because 1.5 might be retired in 2026.
-        target_model = None
-        all_models = []
-        try:
-            for m in client.models.list():
-                all_models.append(m.name)
-                if 'flash' in m.name.lower() and 'legacy' not in m.name.lower():
-                    target_model = m.name
-                    # Prefer the latest/highest version if multiple? 
-                    # Usually the list order or first match is fine for now.
-                    # Let's break on first valid flash to be fast.
-                    break
-        except Exception as e:
-            print(f"[AI Debug] List models failed: {e}")
-
-        # Fallback to Pro if no Flash
-        if not target_model:
-            for m_name in all_models:
-                if 'pro' in m_name.lower():
-                    target_model = m_name
-                    break
-        
-        # Fallback to *anything*
-        if not target_model and all_models:
-             target_model = all_models[0]
-             
-        # Default safety (if list failed completely)
-        if not target_model:
-            target_model = 'gemini-2.5-flash' # Guess for 2026
+        for m in client.models.list():
+            all_models.append(m.name)
+            if 'flash' in m.name.lower() and 'legacy' not in m.name.lower():
+                # First valid flash is fine, no need to page through the rest
+                return m.name
+    except Exception as e:
+        print(f"[AI Debug] List models failed: {e}")
+        return None
 
-        print(f"[AI Debug] Selected Model: {target_model}")
+    # Fallback to Pro if no Flash
+    for m_name in all_models:
+        if 'pro' in m_name.lower():
+            return m_name
+    
+    # Fallback to *anything*
+    return all_models[0] if all_models else None
+
+def _refresh_model(client):
+    name = _discover_model(client)
+    # If discovery failed, use the default but retry soon instead of waiting a full TTL
+    ttl = AI_MODEL_TTL if name else min(AI_MODEL_TTL, 60)
+    with _model_lock:
+        if name or not _model_cache['name']:
+            _model_cache['name'] = name or DEFAULT_MODEL
+        _model_cache['expires'] = time.time() + ttl
+        _model_cache['refreshing'] = False
+    print(f"[AI Debug] Selected Model: {_model_cache['name']}")
+    return _model_cache['name']
+
+def _select_model(client):
+    """Resolve the model name from cache; stale entries are refreshed in the background"""
+    if AI_MODEL:
+        return AI_MODEL
+    with _model_lock:
+        name = _model_cache['name']
+        stale = time.time() >= _model_cache['expires']
+        spawn = bool(name) and stale and not _model_cache['refreshing']
+        if spawn:
+            _model_cache['refreshing'] = True
+    if not name:
+        # Nothing cached yet (warm-up not done): resolve inline once
+        return _refresh_model(client)
+    if spawn:
+        threading.Thread(target=_refresh_model, args=(client,), name='ai-model-refresh', daemon=True).start()
+    return name
+
+def warm_ai_client():
+    """Create the client and resolve the model in the background so the first chat turn doesn't pay for it"""
+    if AI_BACKEND == 'fake' or AI_MODEL:
+        return
+    client = _get_client()
+    if client:
+        threading.Thread(target=_select_model, args=(client,), name='ai-warmup', daemon=True).start()
+
+def ai_status():
+    """Snapshot of the AI guard rails for dashboards"""
+    return {'inflight': ai_executor.inflight, 'breaker': ai_breaker.state, 'max_concurrency': AI_MAX_CONCURRENCY}
 
-        system_prompt = f"""
+def _build_prompt(prompt, context):
+    return f"""
         You are HeartGuard AI, a friendly and professional medical assistant.
         Your goal is to help users understand cardiovascular health.
         
@@ -69,55 +155,204 @@ def get_ai_response(prompt, context=""):
         
         Answer the user's question: {prompt}
         """
-        
-        print(f"[AI Debug] Sending prompt to {target_model} (New SDK)...")
-        
-        # New SDK Call
-        # Note: model name usually comes as "models/gemini-...", SDK might handle it.
-        # Check if we need to strip 'models/' prefix. 
-        # The new SDK usually accepts it, or just the ID. 
-        # But let's try passing exactly what .list() returned.
-        
-        response = client.models.generate_content(
-            model=target_model,
-            contents=system_prompt
-        )
-        
-        # New SDK response structure access
-        # It might be response.text or response.candidates[0].content...
-        # For simple text generation, .text is usually a property helper.
-        
-        print(f"[AI Debug] Response received: {len(response.text)} chars")
-        return response.text
-        
+
+def _fake_stream(prompt):
+    """Offline stand-in for the streaming SDK call (AI_BACKEND=fake)"""
+    reply = (f"This is an offline HeartGuard reply to: {prompt}. "
+             "Keep your blood pressure in check and consult a doctor for serious concerns.")
+    for word in reply.split(' '):
+        time.sleep(AI_FAKE_DELAY)
+        yield word + ' '
+
+def _generate(prompt, context):
+    """Blocking model call; runs on ai_executor so the request thread can give up on it"""
+    if AI_BACKEND == 'fake':
+        return ''.join(_fake_stream(prompt)).strip()
+
+    client = _get_client()
+    target_model = _select_model(client)
+
+    system_prompt = _build_prompt(prompt, context)
+    
+    print(f"[AI Debug] Sending prompt to {target_model} (New SDK)...")
+    
+    # New SDK Call
+    # Note: model name usually comes as "models/gemini-...", SDK might handle it.
+    # Check if we need to strip 'models/' prefix. 
+    # The new SDK usually accepts it, or just the ID. 
+    # But let's try passing exactly what .list() returned.
+    
+    response = client.models.generate_content(
+        model=target_model,
+        contents=system_prompt
+    )
+    
+    # New SDK response structure access
+    # It might be response.text or response.candidates[0].content...
+    # For simple text generation, .text is usually a property helper.
+    
+    print(f"[AI Debug] Response received: {len(response.text or '')} chars")
+    return response.text
+
+def _stream_into(out, cancelled, prompt, context):
+    """Producer side of stream_ai_response; runs on ai_executor and pushes chunks into `out`"""
+    try:
+        if AI_BACKEND == 'fake':
+            chunks = _fake_stream(prompt)
+        else:
+            client = _get_client()
+            target_model = _select_model(client)
+            print(f"[AI Debug] Streaming prompt to {target_model} (New SDK)...")
+            chunks = (c.text for c in client.models.generate_content_stream(
+                model=target_model,
+                contents=_build_prompt(prompt, context)
+            ) if c.text)
+        for text in chunks:
+            if cancelled.is_set():
+                return
+            out.put(('chunk', text))
+        out.put(('done', None))
     except Exception as e:
-        print(f"[AI Debug] AI Error: {e}")
-        return f"I'm having trouble thinking right now. Error: {e}"
+        out.put(('error', e))
+
+def get_ai_response(prompt, context="", cache_fields=None):
+    """
+    Get response from Gemini API.
+    Fallback to simple rules if key not found.
+    `cache_fields` describe everything in `context` the answer depends on (default: the context itself);
+    replies generated with any context are only cached for that exact context.
+    The call runs on a bounded pool with a deadline and behind a circuit breaker,
+    so a slow upstream costs at most AI_TIMEOUT seconds and fails fast once it keeps erroring.
+    """
+    cache_key, _ = make_key(prompt, cache_fields or context)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if AI_BACKEND != 'fake' and not _get_client():
+        print("[AI Debug] No API Key found in env!")
+        return FALLBACK_MESSAGE
+
+    start = time.monotonic()
+    if not ai_breaker.allow():
+        print("[AI Debug] Circuit open, skipping AI call")
+        _record_ai(start, 'circuit_open')
+        return ERROR_MESSAGE
+
+    deadline = start + AI_TIMEOUT
+    outcome = 'error'
+    for attempt in range(AI_RETRIES + 1):
+        try:
+            future = ai_executor.submit(_generate, prompt, context)
+        except Overloaded:
+            print("[AI Debug] Too many AI calls in flight")
+            ai_breaker.release()
+            outcome = 'overloaded'
+            break
+
+        try:
+            reply = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            print(f"[AI Debug] AI call exceeded {AI_TIMEOUT}s deadline")
+            ai_breaker.record_failure()
+            outcome = 'timeout'
+            break
+        except Exception as e:
+            print(f"[AI Debug] AI Error: {e}")
+            ai_breaker.record_failure()
+            # Only retry while there's budget left for a realistic attempt
+            if deadline - time.monotonic() < AI_RETRY_MIN_BUDGET or not ai_breaker.allow():
+                break
+            continue
+
+        ai_breaker.record_success()
+        _record_ai(start, 'ok')
+        if reply:
+            response_cache.set(cache_key, reply)
+        return reply
+
+    _record_ai(start, outcome)
+    return ERROR_MESSAGE
+
+def stream_ai_response(prompt, context="", cache_fields=None):
+    """
+    Same as get_ai_response, but yields text chunks as the model produces them.
+    Each chunk must arrive within AI_TIMEOUT. Errors are yielded as a final chunk
+    when nothing was produced yet, so the caller always gets a reply to persist.
+    """
+    cache_key, _ = make_key(prompt, cache_fields or context)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    if AI_BACKEND != 'fake' and not _get_client():
+        print("[AI Debug] No API Key found in env!")
+        yield FALLBACK_MESSAGE
+        return
+
+    if not ai_breaker.allow():
+        print("[AI Debug] Circuit open, skipping AI call")
+        yield ERROR_MESSAGE
+        return
+
+    start = time.monotonic()
+    out = queue.Queue()
+    cancelled = threading.Event()
+    try:
+        ai_executor.submit(_stream_into, out, cancelled, prompt, context)
+    except Overloaded:
+        print("[AI Debug] Too many AI calls in flight")
+        ai_breaker.release()
+        _record_ai(start, 'overloaded')
+        yield ERROR_MESSAGE
+        return
+
+    parts = []
+    settled = False  # set once the breaker has been told how the call went
+    try:
+        while True:
+            try:
+                kind, value = out.get(timeout=AI_TIMEOUT)
+            except queue.Empty:
+                print(f"[AI Debug] AI stream stalled for {AI_TIMEOUT}s")
+                ai_breaker.record_failure()
+                settled = True
+                _record_ai(start, 'timeout')
+                break
+            if kind == 'chunk':
+                if not parts:
+                    metrics.observe('ai_first_chunk_seconds', time.monotonic() - start)
+                parts.append(value)
+                yield value
+            elif kind == 'done':
+                ai_breaker.record_success()
+                settled = True
+                _record_ai(start, 'ok')
+                if parts:
+                    response_cache.set(cache_key, ''.join(parts).strip())
+                return
+            else:
+                print(f"[AI Debug] AI Stream Error: {value}")
+                ai_breaker.record_failure()
+                settled = True
+                _record_ai(start, 'error')
+                break
+        if not parts:
+            yield ERROR_MESSAGE
+    finally:
+        # Also reached when the client disconnects: stop the producer early
+        cancelled.set()
+        if not settled:
+            ai_breaker.release()
 
 # --- Email Service ---
 def send_risk_alert(to_email, user_name, result):
     """
-    Send an email with the risk assessment results.
-    Falls back to console print for development.
+    Queue an email with the risk assessment results.
+    Delivery (or the console fallback in development) happens in utils.mailer workers.
     """
-    smtp_server = os.getenv('EMAIL_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('EMAIL_PORT', 587))
-    sender_email = os.getenv('EMAIL_USER')
-    sender_password = os.getenv('EMAIL_PASS')
-    
-    # Developement Mode: If no credentials, log to console
-    if not sender_email or not sender_password:
-        print("\n" + "="*40)
-        print(f" [DEV] EMAIL SIMULATION - To: {to_email}")
-        print(f" Subject: HeartGuard Assessment: {result['risk']} Risk")
-        print(f" Risk: {result['risk']} ({result['prob']}%)")
-        print("="*40 + "\n")
-        return True
-        
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = to_email
-    msg['Subject'] = f"HeartGuard Assessment: {result['risk']} Risk Detected"
+    subject = f"HeartGuard Assessment: {result['risk']} Risk Detected"
     
     risk_color = "red" if result['risk'] == "High" else "green"
     
@@ -139,48 +374,14 @@ def send_risk_alert(to_email, user_name, result):
     </html>
     """
     
-    msg.attach(MIMEText(body, 'html'))
-    
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email Sending Failed: {e}")
-        print("Falling back to console output...")
-        print("\n" + "="*40)
-        print(f" [FALLBACK] EMAIL SIMULATION - To: {to_email}")
-        print(f" Subject: HeartGuard Assessment: {result['risk']} Risk")
-        print(f" Risk: {result['risk']} ({result['prob']}%)")
-        print("="*40 + "\n")
-        return True
+    return enqueue_email(to_email, subject, body, preview=f"Risk: {result['risk']} ({result['prob']}%)")
 
 def send_otp_email(to_email, otp):
     """
-    Send OTP for password reset.
-    Falls back to console print for development.
+    Queue the OTP for password reset.
+    Delivery (or the console fallback in development) happens in utils.mailer workers.
     """
-    smtp_server = os.getenv('EMAIL_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('EMAIL_PORT', 587))
-    sender_email = os.getenv('EMAIL_USER')
-    sender_password = os.getenv('EMAIL_PASS')
-    
-    # Developement Mode: If no credentials, log to console
-    if not sender_email or not sender_password:
-        print("\n" + "="*40)
-        print(f" [DEV] EMAIL SIMULATION - To: {to_email}")
-        print(f" Subject: HeartGuard Password Reset Code")
-        print(f" OTP CODE: {otp}")
-        print("="*40 + "\n")
-        return True
-        
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = to_email
-    msg['Subject'] = "HeartGuard Password Reset Code"
+    subject = "HeartGuard Password Reset Code"
     
     body = f"""
     <html>
@@ -193,21 +394,4 @@ def send_otp_email(to_email, otp):
     </html>
     """
     
-    msg.attach(MIMEText(body, 'html'))
-    
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email Sending Failed: {e}")
-        print("Falling back to console output...")
-        print("\n" + "="*40)
-        print(f" [FALLBACK] EMAIL SIMULATION - To: {to_email}")
-        print(f" Subject: HeartGuard Password Reset Code")
-        print(f" OTP CODE: {otp}")
-        print("="*40 + "\n")
-        return True
+    return enqueue_email(to_email, subject, body, preview=f"OTP CODE: {otp}")
@@ -0,0 +1,127 @@
+import os
+import time
+import secrets
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+import utils.db as db
+
+# Seconds between background sweeps of expired sessions
+SESSION_GC_INTERVAL = int(os.getenv('SESSION_GC_INTERVAL', 600))
+# Only rewrite the expiry of an unchanged session after this many seconds
+SESSION_TOUCH_INTERVAL = int(os.getenv('SESSION_TOUCH_INTERVAL', 300))
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expiry=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expiry = expiry
+        self.modified = False
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Stores session data in the `sessions` table of heartguard.db.
+    The cookie only carries a signed, random session id, so its size and
+    the per-request decode cost stay constant no matter what the session holds.
+    """
+    serializer = TaggedJSONSerializer()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='heartguard-session')
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                conn = db.get_db_connection()
+                row = conn.execute("SELECT data, expiry FROM sessions WHERE sid = ?", (sid,)).fetchone()
+                conn.close()
+                if row and row['expiry'] > time.time():
+                    try:
+                        data = self.serializer.loads(row['data'])
+                        return ServerSideSession(data, sid=sid, expiry=row['expiry'])
+                    except Exception as e:
+                        print(f"[Session] Corrupt session {sid[:8]}: {e}")
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Emptied (e.g. logout): drop the row and the cookie
+        if not session:
+            if not session.new:
+                conn = db.get_db_connection()
+                conn.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                conn.commit()
+                conn.close()
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app)
+        stale = session.expiry is None or (session.expiry - now) < (lifetime - SESSION_TOUCH_INTERVAL)
+        if not (session.modified or session.new or stale):
+            return
+
+        expiry = now + lifetime
+        conn = db.get_db_connection()
+        if session.modified or session.new:
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expiry) VALUES (?, ?, ?)",
+                         (session.sid, self.serializer.dumps(dict(session)), expiry))
+        else:
+            conn.execute("UPDATE sessions SET expiry = ? WHERE sid = ?", (expiry, session.sid))
+        conn.commit()
+        conn.close()
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode()).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+def purge_expired_sessions():
+    conn = db.get_db_connection()
+    deleted = conn.execute("DELETE FROM sessions WHERE expiry < ?", (time.time(),)).rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+_gc_thread = None
+
+def start_session_gc():
+    """Start a daemon thread that periodically deletes expired sessions (once per process)"""
+    global _gc_thread
+    if _gc_thread is not None:
+        return
+
+    def _loop():
+        while True:
+            time.sleep(SESSION_GC_INTERVAL)
+            try:
+                deleted = purge_expired_sessions()
+                if deleted:
+                    print(f"[Session] Purged {deleted} expired sessions")
+            except Exception as e:
+                print(f"[Session] GC Error: {e}")
+
+    _gc_thread = threading.Thread(target=_loop, name='session-gc', daemon=True)
+    _gc_thread.start()
@@ -0,0 +1,38 @@
+"""
+Startup phase timings.
+
+    python -m utils.startup        # prints how long each phase takes until the app can serve
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+timings = {}  # phase -> milliseconds, in the order phases ran
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+        print(f"[Startup] {name}: {timings[name]:.0f} ms")
+
+def main():
+    with phase('import app'):
+        import app as heartguard
+    heartguard.setup_app()
+    ready_ms = sum(timings.values())
+    with phase('first request'):
+        heartguard.app.test_client().get('/')
+    with phase('models (lazy, first prediction)'):
+        heartguard.predictor.preload()
+
+    print("\nStartup report")
+    for name, ms in timings.items():
+        print(f"  {name:<36}{ms:>8.0f} ms")
+    print(f"  {'ready to serve':<36}{ready_ms:>8.0f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
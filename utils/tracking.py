@@ -1,36 +1,103 @@
-import pandas as pd
-import os
-from datetime import datetime
-import streamlit as st
-
-LOG_FILE = 'activity_log.csv'
-
-def init_log_file():
-    if not os.path.exists(LOG_FILE):
-        df = pd.DataFrame(columns=['user_id', 'date', 'activity', 'duration_mins', 'notes'])
-        df.to_csv(LOG_FILE, index=False)
-
-def log_activity(user_id, activity_type, duration, notes=""):
-    init_log_file()
-    new_entry = {
-        'user_id': user_id,
-        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'activity': activity_type,
-        'duration_mins': duration,
-        'notes': notes
+import datetime
+import utils.db as db
+
+# Activity tracking on the SQLite activity_logs table. Every query is a range scan of
+# idx_activity_logs_user_date, so logging is a single insert and stats cost O(days), not O(rows).
+
+def _today():
+    return datetime.date.today()
+
+def log_activity(username, activity, duration, date=None):
+    """Record one activity session; duration in minutes, date defaults to today"""
+    duration = int(duration)
+    if duration <= 0:
+        raise ValueError("Duration must be a positive number of minutes")
+    db.log_activity(username, activity.strip(), duration, (date or _today()).isoformat())
+
+def get_recent_activities(username, limit=10):
+    conn = db.get_db_connection()
+    rows = conn.execute("""
+        SELECT activity, duration, date FROM activity_logs
+        WHERE username = ? ORDER BY date DESC, id DESC LIMIT ?
+    """, (username, limit)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_streaks(username, today=None):
+    """
+    Consecutive active days: 'current' counts back from today (or yesterday, so the streak
+    survives until the day is over) and 'longest' is the best run ever.
+    """
+    today = today or _today()
+    conn = db.get_db_connection()
+    # Gaps and islands: consecutive days share the same (day number - row number)
+    runs = conn.execute("""
+        SELECT MAX(day) AS last_day, COUNT(*) AS length FROM (
+            SELECT day, day - ROW_NUMBER() OVER (ORDER BY day) AS island FROM (
+                SELECT DISTINCT CAST(julianday(date) AS INTEGER) AS day
+                FROM activity_logs WHERE username = ? AND julianday(date) IS NOT NULL
+            )
+        ) GROUP BY island
+    """, (username,)).fetchall()
+    conn.close()
+
+    today_day = today.toordinal() + 1721424  # julianday() of today, truncated like the query
+    current = next((r['length'] for r in runs if r['last_day'] >= today_day - 1), 0)
+    longest = max((r['length'] for r in runs), default=0)
+    return {'current': current, 'longest': longest}
+
+def _totals_by(username, period_sql, since):
+    conn = db.get_db_connection()
+    rows = conn.execute(f"""
+        SELECT {period_sql} AS period, SUM(duration) AS minutes, COUNT(*) AS sessions,
+               COUNT(DISTINCT date) AS active_days
+        FROM activity_logs WHERE username = ? AND date >= ?
+        GROUP BY period ORDER BY period
+    """, (username, since.isoformat())).fetchall()
+    conn.close()
+    return {r['period']: dict(r) for r in rows}
+
+def get_weekly_stats(username, weeks=8, today=None):
+    """Minutes, sessions and active days for each of the last `weeks` weeks (Monday start), oldest first"""
+    today = today or _today()
+    this_monday = today - datetime.timedelta(days=today.weekday())
+    starts = [this_monday - datetime.timedelta(weeks=i) for i in range(weeks - 1, -1, -1)]
+    found = _totals_by(username, "date(date, '-6 days', 'weekday 1')", starts[0])
+    return [found.get(s.isoformat(), {'period': s.isoformat(), 'minutes': 0, 'sessions': 0, 'active_days': 0})
+            for s in starts]
+
+def get_monthly_stats(username, months=6, today=None):
+    """Minutes, sessions and active days for each of the last `months` calendar months, oldest first"""
+    today = today or _today()
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        starts.append(datetime.date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    starts.reverse()
+    found = _totals_by(username, "strftime('%Y-%m', date)", starts[0])
+    return [found.get(s.strftime('%Y-%m'), {'period': s.strftime('%Y-%m'), 'minutes': 0, 'sessions': 0, 'active_days': 0})
+            for s in starts]
+
+def get_activity_breakdown(username, days=30, today=None):
+    """Minutes and sessions per activity over the last `days` days, largest first"""
+    since = (today or _today()) - datetime.timedelta(days=days - 1)
+    conn = db.get_db_connection()
+    rows = conn.execute("""
+        SELECT activity, SUM(duration) AS minutes, COUNT(*) AS sessions
+        FROM activity_logs WHERE username = ? AND date >= ?
+        GROUP BY activity ORDER BY minutes DESC
+    """, (username, since.isoformat())).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_summary(username, today=None):
+    """Everything the profile page shows about a user's activity"""
+    today = today or _today()
+    return {
+        'streak': get_streaks(username, today=today),
+        'week_minutes': get_weekly_stats(username, weeks=1, today=today)[0]['minutes'],
+        'month_minutes': get_monthly_stats(username, months=1, today=today)[0]['minutes'],
+        'breakdown': get_activity_breakdown(username, today=today),
+        'recent': get_recent_activities(username, limit=5),
     }
-    df = pd.read_csv(LOG_FILE)
-    df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-    df.to_csv(LOG_FILE, index=False)
-
-def get_user_history(user_id):
-    init_log_file()
-    df = pd.read_csv(LOG_FILE)
-    if 'user_id' in df.columns:
-        return df[df['user_id'] == user_id].sort_values(by='date', ascending=False)
-    return pd.DataFrame()
-
-def get_weekly_stats(user_id):
-    df = get_user_history(user_id)
-    # Simple aggregation logic could go here
-    return df
@@ -0,0 +1,72 @@
+import utils.metrics as metrics
+
+# Counterfactual changes to modifiable factors. Each factor is one lever swept over one or
+# more levels: (label, applies to this assessment?, change); only its best level is shown.
+# Inputs are predictor dicts (age in days, height cm, weight kg).
+def _bmi(d):
+    return d['weight'] / ((d['height'] / 100) ** 2)
+
+SCENARIOS = {
+    'systolic': [
+        ('Lower systolic pressure by 10 mmHg', lambda d: d['ap_hi'] > 110, lambda d: {'ap_hi': d['ap_hi'] - 10}),
+        ('Lower systolic pressure by 20 mmHg', lambda d: d['ap_hi'] > 120, lambda d: {'ap_hi': d['ap_hi'] - 20}),
+    ],
+    'diastolic': [
+        ('Lower diastolic pressure by 10 mmHg', lambda d: d['ap_lo'] > 75, lambda d: {'ap_lo': d['ap_lo'] - 10}),
+    ],
+    'weight': [
+        ('Lose 5 kg', lambda d: _bmi(d) > 23, lambda d: {'weight': d['weight'] - 5}),
+        ('Lose 10 kg', lambda d: _bmi(d) > 26, lambda d: {'weight': d['weight'] - 10}),
+    ],
+    'smoke': [('Quit smoking', lambda d: d['smoke'], lambda d: {'smoke': 0})],
+    'alco': [('Stop drinking alcohol', lambda d: d['alco'], lambda d: {'alco': 0})],
+    'active': [('Become physically active', lambda d: not d['active'], lambda d: {'active': 1})],
+    'cholesterol': [('Bring cholesterol to normal', lambda d: d['cholesterol'] > 1, lambda d: {'cholesterol': 1})],
+    'gluc': [('Bring glucose to normal', lambda d: d['gluc'] > 1, lambda d: {'gluc': 1})],
+}
+
+# Changes smaller than this (percentage points) aren't worth showing
+MIN_EFFECT = 0.5
+
+@metrics.timed('predictor_duration_seconds', {'op': 'what_if'})
+def what_if(predictor, data, limit=5):
+    """
+    Score the assessment and every applicable level of every factor in one batched model call.
+    Returns one row per factor (its best level), sorted by risk reduction: [{'label', 'prob', 'delta'}]
+    in percent, plus a combined scenario applying exactly the changes listed. Nothing is logged.
+    """
+    if not predictor.models:
+        return []
+    applicable = [(factor, label, change(data)) for factor, levels in SCENARIOS.items()
+                  for label, applies, change in levels if applies(data)]
+    if not applicable:
+        return []
+    variants = [data] + [{**data, **change} for _, _, change in applicable]
+    try:
+        probs = predictor.predict_proba_batch(predictor.to_frame(variants)) * 100
+    except Exception as e:
+        print(f"[WhatIf] Scoring Error: {e}")
+        return []
+
+    base = probs[0]
+    best = {}  # factor -> (label, change, prob) of its lowest-risk level
+    for (factor, label, change), p in zip(applicable, probs[1:]):
+        if factor not in best or p < best[factor][2]:
+            best[factor] = (label, change, p)
+    shown = [s for s in best.values() if base - s[2] >= MIN_EFFECT]
+    shown.sort(key=lambda s: base - s[2], reverse=True)
+    shown = shown[:limit]
+    results = [{'label': label, 'prob': round(float(p), 1), 'delta': round(float(base - p), 1)} for label, _, p in shown]
+    if len(shown) > 1:
+        # Only the changes listed above (one level per factor), so the row means what its label says
+        combined = {}
+        for _, change, _ in shown:
+            combined.update(change)
+        try:
+            p = predictor.predict_proba_batch(predictor.to_frame([{**data, **combined}]))[0] * 100
+        except Exception as e:
+            print(f"[WhatIf] Scoring Error: {e}")
+            return results
+        results.append({'label': 'All of these changes together', 'prob': round(float(p), 1),
+                        'delta': round(float(base - p), 1), 'combined': True})
+    return results